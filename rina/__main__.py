@@ -1,12 +1,20 @@
+import atexit
+import os
 import sys
+from contextlib import nullcontext
 
 from . import config_logger
 from .arguments import parse_args
+from .journal import Journal, apply_records, latest_journal, new_journal_path
+from .journal import rollback as journal_rollback
+from .plan import save_plan
 from .utils import (
     SEP_BOLD,
     SEP_SLIM,
     SEP_WIDTH,
     Config,
+    JsonlWriter,
+    Spool,
     Status,
     get_choice_as_int,
     stderr_write,
@@ -35,18 +43,35 @@ def _print_header(args):
     stderr_write(f"{SEP_BOLD}\n")
 
 
-def process_stream(stream, args):
-    changed = []
-    failure = []
+def process_stream(stream, args, previous=(), journal_path=None):
+    """
+    Print the results of a stream and apply the changes. `previous` are
+    records from an earlier, resumed run, merged into the change set. If
+    `journal_path` is given, operations already in that journal are skipped.
+    Returns the set of directories where files were changed.
+    """
+    # Keep compact records rather than the objects, spilled to disk on large runs
+    changed = Spool()
+    touched = set()
+    failure = Spool()
     total = 0
 
+    for r in previous:
+        total += 1
+        if r.status == Status.UPDATED:
+            changed.append(r)
+        elif r.status == Status.FAILURE:
+            failure.append(r)
+    if total:
+        stderr_write(f"Resumed {total} results from the previous run.\n")
+
     for obj in stream:
         total += 1
         obj.print()
         if obj.status == Status.UPDATED:
-            changed.append(obj)
+            changed.append(obj.to_record())
         elif obj.status == Status.FAILURE:
-            failure.append(obj)
+            failure.append(obj.to_record())
 
     if total:
         stderr_write(f"{SEP_BOLD}\n")
@@ -56,8 +81,38 @@ def process_stream(stream, args):
     )
     if not changed:
         stderr_write("No change can be made.\n")
-        return
+        return touched
+    if args.save_plan:
+        save_plan(args.save_plan, changed, args.command)
+
+    if Config.JSONL is not None:
+        # No menu for machine-readable output, apply only if confirmed
+        if not Config.YES:
+            return touched
+    else:
+        _choose_action(changed, failure)
+
+    failure.close()
+    errors = []
+    stderr_write(f"{SEP_BOLD}\nApplying changes...\n")
+    with _open_journal(journal_path) as journal:
+        for r, e in progressbar(apply_records(changed, journal), len(changed)):
+            if e is not None:
+                errors.append(e)
+                continue
+            touched.add(os.path.dirname(r.path))
+            if r.newpath:
+                touched.add(os.path.dirname(r.newpath))
+    changed.close()
+    for e in errors:
+        stderr_write(f"Failed to process file: {e}\n")
+    if journal is not None:
+        stderr_write(f"Journal: {journal.path}\n")
+    return touched
 
+
+def _choose_action(changed: Spool, failure: Spool):
+    """Prompt until the user chooses to apply changes, or quit."""
     msg = (
         f"{SEP_BOLD}\n"
         "Please choose an option:\n"
@@ -69,27 +124,52 @@ def process_stream(stream, args):
     while True:
         choice = get_choice_as_int(msg, 4)
         if choice == 1:
-            break
+            return
         if choice == 4:
             sys.exit()
         for obj in changed if choice == 2 else failure:
             obj.print()
 
-    failure.clear()
-    stderr_write(f"{SEP_BOLD}\nApplying changes...\n")
-    for obj in progressbar(changed):
-        try:
-            obj.apply()
-        except OSError as e:
-            failure.append(e)
-    for obj in failure:
-        stderr_write(f"Failed to process file: {obj}\n")
 
+def _open_journal(path=None):
+    if Config.DRYRUN:
+        return nullcontext()
+    return Journal(path, resume=path is not None)
+
+
+def rollback(args):
+    """Undo the changes recorded in a journal."""
+    try:
+        path = args.source or latest_journal()
+    except FileNotFoundError as e:
+        sys.exit(e)
+    stderr_write(f"Rolling back: {path}\n")
+    errors = journal_rollback(path)
+    for e in errors:
+        stderr_write(f"Failed to restore file: {e}\n")
+    if not errors:
+        stderr_write("Rollback finished.\n")
+
+
+def extract_stream(args):
+    """Extract IDs from a list of names, writing tab-separated lines."""
+    from .scraper import extract_ids
+
+    f = sys.stdin if args.source == "-" else open(args.source, encoding="utf-8")
+    with f:
+        names = filter(None, (line.strip() for line in f))
+        write = sys.stdout.write
+        for *row, date in extract_ids(names, max_workers=args.jobs):
+            row.append(strftime(date))
+            write("\t".join(v or "" for v in row) + "\n")
 
-def progressbar(sequence, width: int = SEP_WIDTH):
+
+def progressbar(sequence, total: int = None, width: int = SEP_WIDTH):
     """Make an iterator that returns values from the input sequence while
-    printing a progress bar."""
-    total = len(sequence)
+    printing a progress bar. `total` is required if the sequence has no
+    length."""
+    if total is None:
+        total = len(sequence)
     fmt = f"\rProgress |{{:-<{width}}}| {{:.1%}} Complete".format
     for i, obj in enumerate(sequence, 1):
         stderr_write(fmt("█" * (i * width // total), i / total))
@@ -104,19 +184,64 @@ def main():
     config_logger(args.verbose)
     Config.DRYRUN = args.dryrun
     Config.YES = args.yes
+    if args.output == "jsonl":
+        Config.JSONL = JsonlWriter()
+        atexit.register(Config.JSONL.flush)
+    if args.mirrors:
+        from . import network
+
+        for mirrors in args.mirrors:
+            network.set_mirrors(*mirrors)
 
     _print_header(args)
 
     if args.command == "video":
         from . import files, video
 
+        Config.EXHAUSTIVE = args.exhaustive
+
         if args.type == "keyword":
-            video.from_string(args.source).print()
+            video.from_string(args.source[0], args.offline).print()
+        elif args.watch:
+            from . import watch
+
+            watch.watch(
+                args.source,
+                files.get_scanner(args, exts=video.EXTS),
+                offline=args.offline,
+                trust_names=args.trust_names,
+            )
         elif args.type == "dir":
-            process_stream(video.from_args(args), args)
-            files.update_dir_mtime(args.source)
+            from .runfile import RunFile
+
+            run = RunFile(args.resume)
+            stderr_write(f"Checkpoint: {run.path}\n")
+            completed = False
+            try:
+                # Named after the run, so a resumed run resumes its apply too
+                touched = process_stream(
+                    run.track(video.from_args(args, exclude=run.done)),
+                    args,
+                    run.records(),
+                    new_journal_path(run.path.name),
+                )
+                completed = True
+            except SystemExit:
+                # Quit from the menu, the scan itself was complete
+                completed = True
+                raise
+            finally:
+                # The checkpoint is only needed to resume an interrupted scan
+                run.close(remove=completed)
+                if not completed:
+                    stderr_write(f"Resume with: --resume {run.path}\n")
+            if touched:
+                updated = files.update_ancestors(touched, args.source)
+                stderr_write(f"Directory timestamps updated: {updated}.\n")
         else:
-            process_stream((video.from_path(args.source),), args)
+            process_stream(
+                (video.from_path(args.source[0], offline=args.offline),), args
+            )
 
     elif args.command == "idol":
         from . import idol
@@ -129,13 +254,34 @@ def main():
     elif args.command == "dir":
         from . import files
 
-        files.update_dir_mtime(args.source)
+        files.update_dir_mtime(args.source, full=args.full, manifest=args.manifest)
 
     elif args.command == "concat":
         from . import concat
 
         concat.main(args)
 
+    elif args.command == "dupes":
+        from . import dupes
+
+        dupes.main(args)
+
+    elif args.command == "extract":
+        extract_stream(args)
+
+    elif args.command == "apply":
+        from .plan import apply_plan
+
+        apply_plan(args.source, args.ffmpeg)
+
+    elif args.command == "query":
+        from . import catalog
+
+        catalog.main(args)
+
+    elif args.command == "rollback":
+        rollback(args)
+
     elif args.command == "birth":
         from . import birth
 
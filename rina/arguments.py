@@ -8,7 +8,10 @@ CMD_TYPES = {
     "idol": ("dir", "keyword"),
     "concat": ("dir",),
     "dir": ("dir",),
+    "dupes": ("dir",),
 }
+# Commands accepting multiple directories as the source
+MULTI_ROOT = {"video", "concat", "dir", "dupes"}
 
 
 def _add_source(
@@ -17,10 +20,18 @@ def _add_source(
     add_filter: bool = True,
     recursive: bool = True,
 ):
-    parser.add_argument(
-        "source",
-        help=f'the source. expect types: {", ".join(CMD_TYPES[command])}',
-    )
+    if command in MULTI_ROOT:
+        parser.add_argument(
+            "source",
+            nargs="+",
+            help=f'the source. expect types: {", ".join(CMD_TYPES[command])}\n'
+            "multiple directories can be given",
+        )
+    else:
+        parser.add_argument(
+            "source",
+            help=f'the source. expect types: {", ".join(CMD_TYPES[command])}',
+        )
     if not add_filter:
         return
     r = parser.add_mutually_exclusive_group()
@@ -65,6 +76,41 @@ def _add_source(
         action="append",
         help="skip directories that match the glob, can be repeated",
     )
+    parser.add_argument(
+        "-w",
+        dest="workers",
+        type=int,
+        default=0,
+        help="list directories with this many threads, e.g. on network shares\n"
+        "(default: serial)",
+    )
+    parser.add_argument(
+        "--unordered",
+        dest="unordered",
+        action="store_true",
+        help="with -w, yield files as directories are listed, not in walk order",
+    )
+
+
+def _add_save_plan(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--save-plan",
+        dest="save_plan",
+        type=Path,
+        help="save the computed changes to a plan file, to be applied later\n"
+        "by the 'apply' command without scanning again",
+    )
+
+
+def _add_manifest(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--manifest",
+        dest="manifest",
+        help="read the files from a listing instead of walking the directories,\n"
+        "'-' for stdin. One file per line: path, size, mtime, tab-separated:\n"
+        "  find . -type f -printf '%%p\\t%%s\\t%%T@\\n'\n"
+        "relative paths are resolved against the directories given",
+    )
 
 
 def parse_args():
@@ -96,6 +142,23 @@ def parse_args():
         action="store_true",
         help="automatically confirm all prompts",
     )
+    parser.add_argument(
+        "-o",
+        "--output",
+        choices=("text", "jsonl"),
+        default="text",
+        help="output format (default %(default)s). jsonl writes one JSON object\n"
+        "per result and skips the menu, changes are applied only with -y",
+    )
+    parser.add_argument(
+        "--mirror",
+        dest="mirrors",
+        action="append",
+        type=mirror_spec,
+        metavar="SITE=MIRROR[,...]",
+        help="route requests to a site through the fastest of its mirrors,\n"
+        'e.g. "www.javbus.com=mirror1.example,mirror2.example". repeatable',
+    )
     # sub-parsers
     subparsers = parser.add_subparsers(title="commands", required=True)
 
@@ -115,12 +178,68 @@ def parse_args():
             "  Scrape a single file:\n"
             "      %(prog)s heyzo-2288.mp4\n"
             "  Scrape all videos newer than 7 days in ~/dir:\n"
-            "      %(prog)s ~/dir -n 7D"
+            "      %(prog)s ~/dir -n 7D\n"
+            "  Scrape videos on several disks in parallel:\n"
+            "      %(prog)s /mnt/disk1 /mnt/disk2\n"
+            "  Plan IDs and dates for ~/dir without network access:\n"
+            "      %(prog)s ~/dir --offline\n"
+            "  Rescan ~/dir, skipping files resolved by a previous run:\n"
+            "      %(prog)s ~/dir --incremental\n"
+            "  Rescan ~/dir, without looking up files that are already renamed:\n"
+            "      %(prog)s ~/dir --trust-names\n"
+            "  Process new downloads in ~/dir as soon as they complete:\n"
+            "      %(prog)s ~/dir --watch\n"
+            "  Review changes in a dry run, then apply them without scanning again:\n"
+            "      %(prog)s -d ~/dir --save-plan plan.jsonl\n"
+            "      rina apply plan.jsonl\n"
+            "  Scan a share from the listing made on the storage node:\n"
+            "      ssh nas 'cd /volume1/av && find . -type f -printf ...' |\n"
+            "      rina -y video --manifest - /mnt/av"
         ),
         formatter_class=argparse.RawTextHelpFormatter,
     )
     subparser.set_defaults(command=command)
     _add_source(subparser, command)
+    m = subparser.add_mutually_exclusive_group()
+    m.add_argument(
+        "--offline",
+        dest="offline",
+        action="store_true",
+        help="extract IDs and dates from filenames without network access",
+    )
+    m.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="skip files unchanged since they were last resolved",
+    )
+    subparser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="keep watching the directories and process new files as they\n"
+        "arrive (Linux only)",
+    )
+    subparser.add_argument(
+        "--trust-names",
+        dest="trust_names",
+        action="store_true",
+        help="skip the lookup for files already named as '{ID} {title}'",
+    )
+    _add_save_plan(subparser)
+    subparser.add_argument(
+        "--resume",
+        dest="resume",
+        type=Path,
+        help="resume an interrupted scan, or its apply, from its checkpoint file",
+    )
+    subparser.add_argument(
+        "--exhaustive",
+        dest="exhaustive",
+        action="store_true",
+        help="also search IDs whose prefixes never resolved before",
+    )
+    _add_manifest(subparser)
 
     # idol
     # source: dir, keyword
@@ -144,6 +263,7 @@ def parse_args():
     )
     subparser.set_defaults(command=command)
     _add_source(subparser, command, recursive=False)
+    _add_save_plan(subparser)
 
     # concat
     # source: dir
@@ -165,7 +285,15 @@ def parse_args():
         action="store",
         help="specify the ffmpeg directory (searches $PATH if omitted)",
     )
+    subparser.add_argument(
+        "-j",
+        dest="jobs",
+        type=int,
+        help="number of parallel ffprobe processes (default: CPU count)",
+    )
     _add_source(subparser, command)
+    _add_save_plan(subparser)
+    _add_manifest(subparser)
 
     # dir
     # source: dir
@@ -176,12 +304,204 @@ def parse_args():
         help="update directory timestamps",
         description=(
             "Description:\n"
-            "  Update directory 'Modified Time' based on the newest file contained"
+            "  Update directory 'Modified Time' based on the newest file contained.\n"
+            "  Only directories changed since the last run are listed again."
         ),
         formatter_class=argparse.RawTextHelpFormatter,
     )
     subparser.set_defaults(command=command)
     _add_source(subparser, command, add_filter=False)
+    subparser.add_argument(
+        "--full",
+        dest="full",
+        action="store_true",
+        help="list every directory, e.g. after files were modified in place",
+    )
+    _add_manifest(subparser)
+
+    # dupes
+    # source: dir
+    command = "dupes"
+    subparser = subparsers.add_parser(
+        command,
+        aliases="p",
+        help="find duplicate videos",
+        description=(
+            "Description:\n"
+            "  Find videos with the same product ID, or the same content by\n"
+            "  sampled fingerprints. Files are never read in full."
+        ),
+        epilog=(
+            "Examples:\n"
+            "  Find duplicates across two disks:\n"
+            "      %(prog)s /mnt/disk1 /mnt/disk2"
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparser.set_defaults(command=command)
+    _add_source(subparser, command)
+
+    # extract
+    # source: a file of names, or stdin
+    command = "extract"
+    subparser = subparsers.add_parser(
+        command,
+        aliases="x",
+        help="extract IDs from a list of names",
+        description=(
+            "Description:\n"
+            "  Extract product IDs and dates from a list of names, one per line,\n"
+            "  without network access. Output is tab-separated:\n"
+            "  name, scraper, search ID, studio, suffix, date"
+        ),
+        epilog=(
+            "Examples:\n"
+            "  Extract IDs from a catalogue export:\n"
+            "      %(prog)s names.txt > ids.tsv\n"
+            "  Extract IDs of files under ~/dir:\n"
+            "      find ~/dir -type f -printf '%%f\\n' | %(prog)s"
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparser.set_defaults(command=command)
+    subparser.add_argument(
+        "-j",
+        dest="jobs",
+        type=int,
+        help="number of worker processes (default: CPU count)",
+    )
+    subparser.add_argument(
+        "source",
+        nargs="?",
+        default="-",
+        help="a file of names, or '-' for stdin (default %(default)s)",
+    )
+
+    # apply
+    # source: a plan file
+    command = "apply"
+    subparser = subparsers.add_parser(
+        command,
+        aliases="a",
+        help="apply a saved plan",
+        description=(
+            "Description:\n"
+            "  Apply the changes saved by '--save-plan' without scanning again.\n"
+            "  Changes whose files were modified since are skipped. Running it\n"
+            "  again resumes an interrupted apply."
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparser.set_defaults(command=command)
+    subparser.add_argument(
+        "-f",
+        dest="ffmpeg",
+        action="store",
+        help="specify the ffmpeg directory (searches $PATH if omitted)",
+    )
+    subparser.add_argument("source", type=Path, help="the plan file")
+
+    # rollback
+    # source: a journal file
+    command = "rollback"
+    subparser = subparsers.add_parser(
+        command,
+        aliases="u",
+        help="undo the changes of an applied run",
+        description=(
+            "Description:\n"
+            "  Undo the renames and timestamp updates recorded in a journal.\n"
+            "  A journal is written each time changes are applied."
+        ),
+        epilog=(
+            "Examples:\n"
+            "  Undo the most recent run:\n"
+            "      %(prog)s\n"
+            "  Undo a specific run:\n"
+            "      %(prog)s ~/.local/share/rina/journals/20240101-120000.jsonl"
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparser.set_defaults(command=command)
+    subparser.add_argument(
+        "source",
+        nargs="?",
+        type=Path,
+        help="the journal file (default: the most recent one)",
+    )
+
+    # query
+    # source: dirs, optional
+    command = "query"
+    subparser = subparsers.add_parser(
+        command,
+        aliases="q",
+        help="query the library catalog",
+        description=(
+            "Description:\n"
+            "  Query the persistent catalog of video files without scanning.\n"
+            "  The catalog is updated from the given directories with '-u'.\n"
+            "  Output is tab-separated: path, product ID, date, title"
+        ),
+        epilog=(
+            "Examples:\n"
+            "  Update the catalog of ~/dir, then list files without an ID:\n"
+            "      %(prog)s -u --no-id ~/dir\n"
+            "  All FC2 files published before 2019:\n"
+            "      %(prog)s --id 'FC2-*' --before 2019\n"
+            "  The newest release of each idol folder:\n"
+            "      %(prog)s --newest ~/idols"
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparser.set_defaults(command=command)
+    subparser.add_argument(
+        "-u",
+        "--update",
+        dest="update",
+        action="store_true",
+        help="update the catalog from the directories first",
+    )
+    subparser.add_argument(
+        "--id",
+        dest="id",
+        help="product IDs matching the glob, case-insensitive",
+    )
+    subparser.add_argument(
+        "--no-id",
+        dest="no_id",
+        action="store_true",
+        help="files without a product ID",
+    )
+    subparser.add_argument(
+        "--before",
+        dest="before",
+        type=date_timestamp,
+        help="published before the date, e.g. 2019 or 2019-06-30",
+    )
+    subparser.add_argument(
+        "--after",
+        dest="after",
+        type=date_timestamp,
+        help="published on or after the date",
+    )
+    subparser.add_argument(
+        "--newest",
+        dest="newest",
+        action="store_true",
+        help="only the newest release of each directory",
+    )
+    subparser.add_argument(
+        "-l",
+        dest="limit",
+        type=int,
+        help="the maximum number of results",
+    )
+    subparser.add_argument(
+        "source",
+        nargs="*",
+        help="directories to query (default: the whole catalog)",
+    )
 
     # birth
     command = "birth"
@@ -228,30 +548,60 @@ def parse_args():
 
     # test source type
     # add args.type to Namespace
-    if args.command in CMD_TYPES:
-        source = Path(args.source)
-        try:
-            source = source.resolve(strict=True)
-            args.type = "dir" if source.is_dir() else "file"
-        except FileNotFoundError as e:
-            if source.name != args.source:
-                # a non-exist path
-                parser.error(e)
-            source = source.stem
-            args.type = "keyword"
-        except (OSError, RuntimeError) as e:
-            parser.error(e)
-        if args.type not in CMD_TYPES[args.command]:
-            parser.error(
-                "expect source type to be '{}', not {}.".format(
-                    ", ".join(CMD_TYPES[args.command]), args.type
-                )
-            )
-        args.source = source
+    if args.command in MULTI_ROOT:
+        sources = []
+        types = set()
+        for source in args.source:
+            sources.append(_check_source(parser, args, source))
+            types.add(args.type)
+        if len(sources) > 1 and types != {"dir"}:
+            parser.error("multiple sources must all be directories.")
+        if getattr(args, "watch", False) and types != {"dir"}:
+            parser.error("--watch expects directories.")
+        manifest = getattr(args, "manifest", None)
+        if manifest is not None:
+            if types != {"dir"}:
+                parser.error("--manifest expects directories.")
+            if getattr(args, "watch", False) or getattr(args, "incremental", False):
+                parser.error("--manifest cannot be used with --watch or --incremental.")
+            if manifest == "-" and args.command != "dir" and not args.yes:
+                parser.error("--manifest - reads stdin, -y is required.")
+        args.source = list(dict.fromkeys(sources))
+    elif args.command in CMD_TYPES:
+        args.source = _check_source(parser, args, args.source)
+    elif args.command == "query":
+        if args.update and not args.source:
+            parser.error("--update expects directories.")
+        for source in args.source:
+            if not Path(source).is_dir():
+                parser.error(f"not a directory: {source}")
 
     return args
 
 
+def _check_source(parser: argparse.ArgumentParser, args, source: str):
+    """Resolve a source and set `args.type`, exit on an invalid source."""
+    path = Path(source)
+    try:
+        path = path.resolve(strict=True)
+        args.type = "dir" if path.is_dir() else "file"
+    except FileNotFoundError as e:
+        if path.name != source:
+            # a non-exist path
+            parser.error(e)
+        path = path.stem
+        args.type = "keyword"
+    except (OSError, RuntimeError) as e:
+        parser.error(e)
+    if args.type not in CMD_TYPES[args.command]:
+        parser.error(
+            "expect source type to be '{}', not {}.".format(
+                ", ".join(CMD_TYPES[args.command]), args.type
+            )
+        )
+    return path
+
+
 def past_timestamp(date: str) -> float:
     """
     Converts a relative date string to a timestamp representing a past date and
@@ -278,6 +628,19 @@ def past_timestamp(date: str) -> float:
     raise argparse.ArgumentError()
 
 
+def date_timestamp(date: str) -> float:
+    """Convert 'YYYY', 'YYYY-MM' or 'YYYY-MM-DD' to a UTC timestamp."""
+    m = re.fullmatch(r"\s*(\d{4})(?:-(\d\d?)(?:-(\d\d?))?)?\s*", date)
+    if not m:
+        raise argparse.ArgumentError()
+    try:
+        return datetime.datetime(
+            int(m[1]), int(m[2] or 1), int(m[3] or 1), tzinfo=datetime.timezone.utc
+        ).timestamp()
+    except ValueError as e:
+        raise argparse.ArgumentError(message=e)
+
+
 def year_range(years: str) -> range:
     """Convert '1988-1990' or '89-90' to range(1988, 1991)."""
 
@@ -295,3 +658,12 @@ def year_range(years: str) -> range:
         raise argparse.ArgumentError()
     start = to_year(m[1])
     return range(start, (to_year(m[2]) if m[2] else start) + 1)
+
+
+def mirror_spec(spec: str) -> tuple:
+    """Convert 'site=m1,m2' to ('site', 'm1', 'm2')."""
+    site, sep, mirrors = spec.partition("=")
+    result = tuple(filter(None, (s.strip() for s in (site, *mirrors.split(",")))))
+    if not sep or len(result) < 2 or result[0] != site.strip():
+        raise argparse.ArgumentError()
+    return result
@@ -0,0 +1,227 @@
+"""
+A persistent catalog of the video files in the library, for queries without
+scanning.
+
+The catalog is a SQLite database of each file's path, inode, size, mtime, and
+the product ID, scraper and date extracted offline from its name. Titles and
+dates of files resolved by incremental video scans are taken from the state
+store. A refresh walks directories with the usual scanner and only extracts
+IDs of files that are new or changed since the last refresh.
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+
+from .files import DiskScanner, scan_roots
+from .scraper import extract_ids
+from .state import StateStore
+from .utils import Config, data_path, stderr_write, strftime
+
+logger = logging.getLogger(__name__)
+
+
+def _range(root: str) -> tuple:
+    """Bounds of the paths under root, for an indexed range query."""
+    return os.path.join(root, ""), root + chr(ord(os.sep) + 1)
+
+
+class Catalog:
+    """A SQLite catalog of files, keyed by path."""
+
+    def __init__(self, path=None):
+        self.path = data_path("catalog.db") if path is None else path
+        self.con = sqlite3.connect(self.path)
+        self.con.executescript(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                product_id TEXT,
+                scraper TEXT,
+                title TEXT,
+                pub_date REAL,
+                source TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_product_id ON files (product_id);
+            CREATE INDEX IF NOT EXISTS idx_pub_date ON files (pub_date);
+            CREATE INDEX IF NOT EXISTS idx_dir ON files (dir, pub_date);
+            CREATE INDEX IF NOT EXISTS idx_inode ON files (dev, ino);"""
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def refresh(self, roots, scanner: DiskScanner, state: StateStore = None):
+        """
+        Bring the catalog up to date with the files under roots. Returns the
+        number of files found, added or changed, and removed.
+        """
+        roots = [os.path.abspath(r) for r in roots]
+        known = {}  # path -> (size, mtime, dev, ino, title)
+        for root in roots:
+            known.update(
+                (r[0], r[1:])
+                for r in self.con.execute(
+                    "SELECT path, size, mtime, dev, ino, title FROM files "
+                    "WHERE path >= ? AND path < ?",
+                    _range(root),
+                )
+            )
+        seen = set()
+        new = []
+        untitled = []
+        for e in scan_roots(roots, scanner.scandir):
+            try:
+                st = e.stat()
+            except OSError as err:
+                logger.error(err)
+                continue
+            seen.add(e.path)
+            row = known.get(e.path)
+            if row is None or row[:2] != (st.st_size, st.st_mtime):
+                new.append((e.path, st))
+            elif row[4] is None:
+                untitled.append((e.path, st))
+
+        rows = []
+        names = (os.path.splitext(os.path.basename(p))[0] for p, _ in new)
+        for (path, st), (_, scraper, *parts, date) in zip(new, extract_ids(names)):
+            pid = "-".join(filter(None, parts)) or None
+            row = [path, os.path.dirname(path), st.st_dev, st.st_ino, st.st_size]
+            row += [st.st_mtime, pid, scraper, None, date, None]
+            rows.append(row)
+        # Scrape results, for files resolved by incremental video scans
+        updates = []
+        if state is not None:
+            for row in rows:
+                self._merge_state(row, state.lookup(row[2], row[3], row[4]))
+            for path, st in untitled:
+                r = state.lookup(st.st_dev, st.st_ino, st.st_size)
+                if r is not None and r[1] is not None:
+                    updates.append((*r, path))
+        removed = known.keys() - seen
+
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.con.executemany(
+                "UPDATE files SET product_id = coalesce(?, product_id), title = ?, "
+                "pub_date = coalesce(?, pub_date), source = ? WHERE path = ?",
+                updates,
+            )
+            self.con.executemany(
+                "DELETE FROM files WHERE path = ?", ((p,) for p in removed)
+            )
+        return len(seen), len(rows), len(removed)
+
+    @staticmethod
+    def _merge_state(row: list, result):
+        if result is None or result[1] is None:
+            return
+        product_id, row[8], pub_date, row[10] = result
+        if product_id:
+            row[6] = product_id
+        if pub_date is not None:
+            row[9] = pub_date
+
+    def query(
+        self,
+        roots=(),
+        product_id: str = None,
+        no_id: bool = False,
+        before: float = None,
+        after: float = None,
+        newest: bool = False,
+        limit: int = None,
+    ):
+        """
+        Returns a cursor of `(path, product_id, pub_date, title)` rows
+        matching all of the conditions.
+
+        Parameters:
+         - roots: Only files under these directories.
+         - product_id: A glob the product ID must match, case-insensitive.
+         - no_id: Only files without a product ID.
+         - before, after: Bounds of the publication date, `after` inclusive.
+         - newest: Only the newest release of each directory.
+         - limit: The maximum number of rows.
+        """
+        where = []
+        params = []
+        if roots:
+            where.append(" OR ".join(["(path >= ? AND path < ?)"] * len(roots)))
+            for root in roots:
+                params.extend(_range(os.path.abspath(root)))
+        if product_id is not None:
+            where.append("upper(product_id) GLOB ?")
+            params.append(product_id.upper())
+        if no_id:
+            where.append("product_id IS NULL")
+        if before is not None:
+            where.append("pub_date < ?")
+            params.append(before)
+        if after is not None:
+            where.append("pub_date >= ?")
+            params.append(after)
+        columns = "path, product_id, pub_date, title"
+        if newest:
+            # SQLite takes the bare columns from the row of the max()
+            columns = "path, product_id, max(pub_date), title"
+            where.append("pub_date IS NOT NULL")
+        sql = f"SELECT {columns} FROM files"
+        if where:
+            sql += " WHERE " + " AND ".join(f"({w})" for w in where)
+        sql += " GROUP BY dir ORDER BY dir" if newest else " ORDER BY path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.con.execute(sql, params)
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+
+def main(args):
+    from .video import EXTS
+
+    with Catalog() as catalog:
+        if args.update:
+            stderr_write("Updating catalog...\n")
+            with StateStore() as state:
+                total, changed, removed = catalog.refresh(
+                    args.source, DiskScanner(exts=EXTS), state
+                )
+            stderr_write(
+                f"Catalog updated. Total: {total}. Changed: {changed}. "
+                f"Removed: {removed}.\n"
+            )
+        rows = catalog.query(
+            args.source,
+            product_id=args.id,
+            no_id=args.no_id,
+            before=args.before,
+            after=args.after,
+            newest=args.newest,
+            limit=args.limit,
+        )
+        if Config.JSONL is not None:
+            write = Config.JSONL.write
+            keys = ("Path", "ProductID", "PubDate", "Title")
+            for path, pid, date, title in rows:
+                write(dict(zip(keys, (path, pid, strftime(date), title))))
+        else:
+            write = sys.stdout.write
+            for path, pid, date, title in rows:
+                row = (path, pid, strftime(date), title)
+                write("\t".join(v or "" for v in row) + "\n")
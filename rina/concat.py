@@ -8,10 +8,19 @@ import sys
 import tempfile
 from collections import defaultdict
 from pathlib import Path
+from threading import BoundedSemaphore
 from typing import Tuple
 
-from .files import DiskScanner, get_scanner
-from .utils import SEP_BOLD, AVInfo, Config, Status, get_choice_as_int, stderr_write
+from .files import DiskScanner, get_scanner, scan_roots
+from .utils import (
+    SEP_BOLD,
+    AVInfo,
+    Config,
+    Status,
+    get_choice_as_int,
+    stderr_write,
+    thread_map,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +31,7 @@ else:
     FFMPEG = "ffmpeg"
     FFPROBE = "ffprobe"
 EXTS = {"avi", "m2ts", "m4v", "mkv", "mov", "mp4", "mpeg", "mpg", "ts", "wmv"}
+PROBES_PER_DEVICE = 8  # Concurrent ffprobe processes reading the same device
 
 
 class ConcatGroup(AVInfo):
@@ -29,8 +39,17 @@ class ConcatGroup(AVInfo):
     applied: bool = False
 
     def __init__(
-        self, source: Tuple[Path], output: Path, ffmpeg=FFMPEG, ffprobe=FFPROBE
+        self,
+        source: Tuple[Path],
+        output: Path,
+        ffmpeg=FFMPEG,
+        ffprobe=FFPROBE,
+        streams: list = None,
     ) -> None:
+        """
+        `streams` are the results of `probe` for each source, or the exceptions
+        raised. If None, the sources are probed one after another.
+        """
         self.source = source
         self.output = output
         self.ffmpeg = ffmpeg
@@ -40,7 +59,9 @@ class ConcatGroup(AVInfo):
             "Output": output,
         }
         try:
-            diffs = tuple(self._find_diffs())
+            if streams is None:
+                streams = [probe(file, ffprobe) for file in source]
+            diffs = tuple(self._find_diffs(streams))
         except Exception as e:
             self.status = Status.ERROR
             self.result["Error"] = e
@@ -51,28 +72,16 @@ class ConcatGroup(AVInfo):
         else:
             self.status = Status.UPDATED
 
-    def _find_diffs(self):
+    def _find_diffs(self, streams: list):
         """
         Find videos with different streams. If such differences are found, yield
         formated lines representing filenames and stream details.
         """
         diffs = []
         first = None
-        for file in self.source:
-            stream = subprocess.run(
-                (self.ffprobe, "-loglevel", "quiet", "-show_entries",
-                 "stream=index,codec_name,width,height,time_base",
-                 "-print_format", "json", file),
-                capture_output=True,
-                text=True,
-                check=True,
-            ).stdout  # fmt: skip
-            # a list of dicts
-            stream = tuple(
-                d
-                for d in json.loads(stream)["streams"]
-                if d.get("codec_name") not in ("bin_data", None)
-            )
+        for file, stream in zip(self.source, streams):
+            if isinstance(stream, Exception):
+                raise stream
             if first is None:
                 first = stream
             elif first == stream:
@@ -88,32 +97,14 @@ class ConcatGroup(AVInfo):
                 yield "- " + "|".join(f"{k}={v}" for k, v in d.items())
 
     def apply(self):
-        if Config.DRYRUN:
-            stderr_write(f"[DRYRUN] Output: '{self.output}'\n")
-            self.applied = True
-            return
+        self.applied = concat_files(self.source, self.output, self.ffmpeg)
 
-        tmpfd, tmpfile = tempfile.mkstemp()
-        try:
-            # ffmpeg escaping
-            # https://www.ffmpeg.org/ffmpeg-utils.html#Quoting-and-escaping
-            with os.fdopen(tmpfd, "w", encoding="utf-8") as f:
-                f.writelines(
-                    "file '{}'\n".format(os.fspath(p).replace("'", "'\\''"))
-                    for p in self.source
-                )
-            subprocess.run(
-                (self.ffmpeg, "-hide_banner", "-f", "concat", "-safe", "0",
-                 "-i", tmpfile, "-c", "copy", self.output),
-                check=True,
-            )  # fmt: skip
-        except subprocess.CalledProcessError as e:
-            logger.error(e)
-            self.output.unlink(missing_ok=True)
-        else:
-            self.applied = True
-        finally:
-            os.unlink(tmpfile)
+    def to_plan(self) -> dict:
+        return {
+            "op": "concat",
+            "source": [os.fspath(p) for p in self.source],
+            "output": os.fspath(self.output),
+        }
 
     def remove_source(self):
         if not self.applied:
@@ -133,6 +124,99 @@ class ConcatGroup(AVInfo):
                 stderr_write(f"Remove: {file}\n")
 
 
+def probe(file, ffprobe=FFPROBE) -> tuple:
+    """Returns the streams of a video file as a tuple of dicts."""
+    stream = subprocess.run(
+        (ffprobe, "-loglevel", "quiet", "-show_entries",
+         "stream=index,codec_name,width,height,time_base",
+         "-print_format", "json", file),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout  # fmt: skip
+    return tuple(
+        d
+        for d in json.loads(stream)["streams"]
+        if d.get("codec_name") not in ("bin_data", None)
+    )
+
+
+def probe_groups(
+    groups,
+    ffmpeg=FFMPEG,
+    ffprobe=FFPROBE,
+    max_workers: int = None,
+    per_device: int = PROBES_PER_DEVICE,
+):
+    """
+    Probe the sources of `(source, output)` groups on a thread pool and yield
+    ConcatGroup objects as their probes complete. The pool is sized by the CPU
+    count, and at most `per_device` probes read the same device at a time.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    semaphores = {}  # st_dev -> BoundedSemaphore
+    pending = {}  # id -> [source, output, streams, remaining]
+
+    def tasks():
+        for i, (source, output) in enumerate(groups):
+            try:
+                dev = os.stat(source[0]).st_dev
+            except OSError:
+                dev = None
+            sem = semaphores.get(dev)
+            if sem is None:
+                sem = semaphores[dev] = BoundedSemaphore(per_device)
+            pending[i] = [source, output, [None] * len(source), len(source)]
+            for j, file in enumerate(source):
+                yield i, j, file, sem
+
+    def work(task):
+        file, sem = task[2:]
+        try:
+            with sem:
+                return probe(file, ffprobe)
+        except Exception as e:
+            return e
+
+    for (i, j, *_), stream in thread_map(work, tasks(), max_workers):
+        group = pending[i]
+        group[2][j] = stream
+        group[3] -= 1
+        if not group[3]:
+            del pending[i]
+            yield ConcatGroup(group[0], group[1], ffmpeg, ffprobe, group[2])
+
+
+def concat_files(source, output: Path, ffmpeg=FFMPEG) -> bool:
+    """Losslessly concatenate source files into output, returns success."""
+    if Config.DRYRUN:
+        stderr_write(f"[DRYRUN] Output: '{output}'\n")
+        return True
+
+    tmpfd, tmpfile = tempfile.mkstemp()
+    try:
+        # ffmpeg escaping
+        # https://www.ffmpeg.org/ffmpeg-utils.html#Quoting-and-escaping
+        with os.fdopen(tmpfd, "w", encoding="utf-8") as f:
+            f.writelines(
+                "file '{}'\n".format(os.fspath(p).replace("'", "'\\''"))
+                for p in source
+            )
+        subprocess.run(
+            (ffmpeg, "-hide_banner", "-f", "concat", "-safe", "0",
+             "-i", tmpfile, "-c", "copy", output),
+            check=True,
+        )  # fmt: skip
+    except subprocess.CalledProcessError as e:
+        logger.error(e)
+        output.unlink(missing_ok=True)
+        return False
+    else:
+        return True
+    finally:
+        os.unlink(tmpfile)
+
+
 def _find_ffmpeg(ffmpeg):
     if ffmpeg:
         ffmpeg = Path(ffmpeg)
@@ -154,7 +238,8 @@ def _find_ffmpeg(ffmpeg):
 def find_groups(root, scanner: DiskScanner = None):
     """
     Find groups of video files under the same directory with consecutive
-    numbering and yields two-tuples of (source, output).
+    numbering and yields two-tuples of (source, output). `root` can be a list
+    of directories.
     """
     if scanner is None:
         scanner = DiskScanner(exts=EXTS)
@@ -179,7 +264,7 @@ def find_groups(root, scanner: DiskScanner = None):
     groups = defaultdict(dict)
     seen = set()  # Set to avoid output overlapping groups
 
-    for _, files in scanner.walk(root):
+    for _, files in scan_roots(root, scanner.walk):
         groups.clear()
         seen.clear()
         for e in files:
@@ -279,13 +364,8 @@ def user_filter(items, question: str, initial_print: bool = True):
 def main(args):
     ffmpeg, ffprobe = _find_ffmpeg(args.ffmpeg)
     results = []
-    for group in find_groups(args.source, get_scanner(args, exts=EXTS)):
-        group = ConcatGroup(
-            source=group[0],
-            output=group[1],
-            ffmpeg=ffmpeg,
-            ffprobe=ffprobe,
-        )
+    groups = find_groups(args.source, get_scanner(args, exts=EXTS))
+    for group in probe_groups(groups, ffmpeg, ffprobe, args.jobs):
         group.print()
         if group.status == Status.UPDATED:
             results.append(group)
@@ -298,6 +378,10 @@ def main(args):
             SEP_BOLD, sum(len(v.source) for v in results), len(results)
         )
     )
+    if args.save_plan:
+        from .plan import save_plan
+
+        save_plan(args.save_plan, results, args.command)
 
     # apply concatenation
     success = []
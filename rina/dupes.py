@@ -0,0 +1,190 @@
+"""
+Detects duplicate videos by product ID and by sampled content fingerprints.
+
+A fingerprint is a hash of the file size and a few fixed-size blocks spread
+across the file, so multi-GB videos are never read in full. Only files sharing
+their size with another file are fingerprinted, and fingerprints are cached by
+(inode, size, mtime).
+"""
+
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from hashlib import blake2b
+
+from .files import get_scanner, scan_roots
+from .scraper import extract_ids
+from .utils import AVInfo, Status, data_path, stderr_write, thread_map
+from .video import EXTS
+
+logger = logging.getLogger(__name__)
+
+SAMPLES = 5  # Number of sampled blocks
+BLOCKSIZE = 1 << 16  # Size of each block
+
+if hasattr(os, "pread"):
+    _pread = os.pread
+else:
+
+    def _pread(fd: int, n: int, offset: int) -> bytes:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, n)
+
+
+def fingerprint(
+    path, size: int, samples: int = SAMPLES, blocksize: int = BLOCKSIZE
+) -> str:
+    """
+    Returns a hash of the file size and `samples` blocks at evenly spaced
+    offsets, including the first and the last. Small files are hashed whole.
+    """
+    h = blake2b(size.to_bytes(8, "little"), digest_size=16)
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if size <= samples * blocksize:
+            offsets = range(0, size, blocksize)
+        else:
+            step = (size - blocksize) // (samples - 1)
+            offsets = (i * step for i in range(samples))
+        for offset in offsets:
+            h.update(_pread(fd, blocksize, offset))
+    finally:
+        os.close(fd)
+    return h.hexdigest()
+
+
+class FingerprintCache:
+    """A SQLite cache of fingerprints, keyed by device and inode."""
+
+    def __init__(self, path=None):
+        self.path = data_path("fingerprints.db") if path is None else path
+        self.con = sqlite3.connect(self.path)
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS fingerprints (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                fp TEXT NOT NULL,
+                PRIMARY KEY (dev, ino)
+            )"""
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, f: "_File"):
+        row = self.con.execute(
+            "SELECT fp FROM fingerprints "
+            "WHERE dev = ? AND ino = ? AND size = ? AND mtime = ?",
+            (f.dev, f.ino, f.size, f.mtime),
+        ).fetchone()
+        return row and row[0]
+
+    def put(self, f: "_File", fp: str):
+        self.con.execute(
+            "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)",
+            (f.dev, f.ino, f.size, f.mtime, fp),
+        )
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+
+class _File:
+    __slots__ = ("path", "dev", "ino", "size", "mtime")
+
+    def __init__(self, path: str, st: os.stat_result):
+        self.path = path
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+
+
+class DupeSet(AVInfo):
+    """A set of files that are likely the same release."""
+
+    status = Status.WARNING
+    keywidth = 9
+
+    def __init__(self, kind: str, key: str, files: list):
+        self.files = files
+        self.result = {
+            "Type": kind,
+            "Key": key,
+            "Files": tuple(f"{f.path} ({f.size:,} bytes)" for f in files),
+        }
+
+
+def find_dupes(roots, scanner, cache: FingerprintCache = None):
+    """
+    Scan roots and yield DupeSet objects: first files with the same product
+    ID, then files with the same content. Hard links of a file are not
+    duplicates of each other.
+    """
+    files = []
+    for e in scan_roots(roots, scanner.scandir):
+        try:
+            files.append(_File(e.path, e.stat()))
+        except OSError as err:
+            logger.error(err)
+    stderr_write(f"Found {len(files)} files.\n")
+
+    # By product ID, extracted offline from the names
+    groups = defaultdict(list)
+    names = (os.path.splitext(os.path.basename(f.path))[0] for f in files)
+    for f, row in zip(files, extract_ids(names)):
+        if row[2]:
+            groups["-".join(filter(None, row[2:5]))].append(f)
+    for key, group in groups.items():
+        if len({(f.dev, f.ino) for f in group}) > 1:
+            yield DupeSet("ProductID", key, group)
+
+    # By content, only among distinct files of the same size
+    groups.clear()
+    for f in {(f.dev, f.ino): f for f in files}.values():
+        groups[f.size].append(f)
+    candidates = [f for group in groups.values() if len(group) > 1 for f in group]
+    groups.clear()
+    missing = []
+    for f in candidates:
+        fp = cache.get(f) if cache is not None else None
+        if fp:
+            groups[fp].append(f)
+        else:
+            missing.append(f)
+    stderr_write(
+        f"Fingerprinting {len(missing)} files "
+        f"({len(candidates) - len(missing)} cached)...\n"
+    )
+    for f, fp in thread_map(_fingerprint, missing):
+        if fp is None:
+            continue
+        if cache is not None:
+            cache.put(f, fp)
+        groups[fp].append(f)
+    for fp, group in groups.items():
+        if len(group) > 1:
+            yield DupeSet("Content", fp, group)
+
+
+def _fingerprint(f: _File):
+    try:
+        return fingerprint(f.path, f.size)
+    except OSError as e:
+        logger.error(e)
+
+
+def main(args):
+    total = 0
+    with FingerprintCache() as cache:
+        for dupe in find_dupes(args.source, get_scanner(args, exts=EXTS), cache):
+            dupe.print()
+            total += 1
+    stderr_write(f"Scan finished. Duplicate sets: {total}.\n")
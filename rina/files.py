@@ -2,9 +2,15 @@ import fnmatch
 import logging
 import os
 import re
-from pathlib import Path
+import stat
+import sys
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from queue import Queue
+from threading import Event, Thread
 from typing import Generator
 
+from .state import DirSnapshot
 from .utils import Config, stderr_write, strftime
 
 logger = logging.getLogger(__name__)
@@ -14,6 +20,9 @@ _EADIR = "@eaDir"  # Synology hidden directory
 class DiskScanner:
     exts: set = None
     newer: float = None
+    workers: int = 0
+    ordered: bool = True
+    manifest: str = None
 
     def __init__(
         self,
@@ -24,6 +33,9 @@ class DiskScanner:
         excludes: list = None,
         exclude_dirs: list = None,
         newer: float = None,
+        workers: int = 0,
+        ordered: bool = True,
+        manifest: str = None,
     ) -> None:
         """
         Initialize a DiskScanner for scanning directories with various filters.
@@ -36,60 +48,72 @@ class DiskScanner:
          - excludes (list): Glob patterns for files to exclude.
          - exclude_dirs (list): Glob patterns for directories to exclude.
          - newer (float): Timestamp; files newer than this will be included.
+         - workers (int): If greater than 1, list directories and run filters
+           concurrently on this many threads.
+         - ordered (bool): In parallel mode, yield in the same order as a
+           serial scan. Otherwise, directories are yielded as they are listed.
+         - manifest (str): A file listing (see `read_manifest`), or "-" for
+           stdin, to scan instead of the filesystem.
         """
-        self.filters = []
-        self.dirfilters = []
         self.recursive = recursive
+        if workers > 1:
+            self.workers = workers
+            self.ordered = ordered
+        if manifest is not None:
+            self.manifest = manifest
+            self._manifest = read_manifest(manifest)
 
         if exts is not None:
             assert isinstance(exts, set), "expect `exts` to be 'set'"
             self.exts = exts
-            self.filters.append(self._ext_filter)
-        if includes is not None:
-            self.filters.append(self._get_glob_filter(includes))
-        if excludes is not None:
-            self.filters.append(self._get_glob_filter(excludes, True))
-        if exclude_dirs is not None:
-            self.dirfilters.append(self._get_glob_filter(exclude_dirs, True))
         if newer is not None:
             self.newer = newer
-            self.filters.append(self._mtime_filter)
+
+        # Fused predicates for the scans, tested as entries are listed
+        self.match = self._compile(includes, excludes)
+        self.dirmatch = self._get_glob_match(None, exclude_dirs)
 
     @staticmethod
-    def _get_glob_filter(globs: list, inverse: bool = False):
+    def _get_glob_match(includes: list, excludes: list):
         """
-        Create a glob-based filter function for file inclusion or exclusion.
-
-        Parameters:
-         - globs (list[str]): A list of globs to match file names against.
-         - inverse (bool): If True, exclude files that match the pattern.
+        Compile include and exclude globs into a single regex, returns its
+        match method, or None if there are no globs.
         """
-        globs = re.compile("|".join(map(fnmatch.translate, globs)), re.I).match
-        if inverse:
-            return lambda es: (e for e in es if not globs(e.name))
-        else:
-            return lambda es: (e for e in es if globs(e.name))
+        pattern = ""
+        if excludes:
+            pattern = "(?!%s)" % "|".join(map(fnmatch.translate, excludes))
+        if includes:
+            pattern += "(?:%s)" % "|".join(map(fnmatch.translate, includes))
+        if pattern:
+            return re.compile(pattern, re.I).match
 
-    def _ext_filter(self, es):
+    def _compile(self, includes: list, excludes: list):
         """
-        Filter function to include files based on their extensions. Extension is
-        everything from the last dot to the end, ignoring leading dots.
+        Combine the file filters into one predicate, returns None if there
+        are no filters. The mtime is tested last as it requires a stat call.
         """
         exts = self.exts
-        for e in es:
-            p = e.name.rpartition(".")
-            if p[0].rstrip(".") and p[2].lower() in exts:
-                yield e
-
-    def _mtime_filter(self, es):
-        """Filter function to include files based on their mtime."""
         newer = self.newer
-        for e in es:
-            try:
-                if e.stat().st_mtime >= newer:
-                    yield e
-            except OSError:
-                pass
+        globs = self._get_glob_match(includes, excludes)
+        if exts is None and globs is None and newer is None:
+            return
+
+        def match(e) -> bool:
+            name = e.name
+            if exts is not None:
+                p = name.rpartition(".")
+                if not (p[0].rstrip(".") and p[2].lower() in exts):
+                    return False
+            if globs is not None and not globs(name):
+                return False
+            if newer is not None:
+                try:
+                    return e.stat().st_mtime >= newer
+                except OSError:
+                    return False
+            return True
+
+        return match
 
     def scandir(
         self, root, yield_dirs: bool = False
@@ -106,18 +130,24 @@ class DiskScanner:
          - os.DirEntry: Directory entries matching the specified filters and
            type.
         """
-        dirs = []
-        files = []
-        output = dirs if yield_dirs else files
-        dirfilters = self.dirfilters
-        filters = self.filters
+        if self.manifest is not None:
+            if yield_dirs:
+                raise ValueError("Directories cannot be scanned from a manifest.")
+            yield from self._scan_manifest(root)
+            return
+        if self.workers:
+            for _, output in self._parallel_walk(root, yield_dirs):
+                yield from output
+            return
+        match = self.match
+        dirmatch = self.dirmatch
         recursive = self.recursive
         stack = [root]
         while stack:
             root = stack.pop()
-            dirs.clear()
-            files.clear()
+            dirs = []
             try:
+                # Matches are yielded as the directory is being listed
                 with os.scandir(root) as it:
                     for e in it:
                         try:
@@ -125,18 +155,18 @@ class DiskScanner:
                         except OSError:
                             is_dir = False
                         if not is_dir:
-                            files.append(e)
-                        elif e.name != _EADIR:
+                            if not yield_dirs and (match is None or match(e)):
+                                yield e
+                        elif e.name != _EADIR and (
+                            dirmatch is None or dirmatch(e.name)
+                        ):
                             dirs.append(e)
-                    for f in dirfilters:
-                        dirs[:] = f(dirs)
-                    stack.extend(reversed(dirs))
-                    for f in filters:
-                        output[:] = f(output)
+                            if yield_dirs and (match is None or match(e)):
+                                yield e
             except OSError as e:
                 logger.error(e)
             else:
-                yield from output
+                stack.extend(reversed(dirs))
             if not recursive:
                 break
 
@@ -150,30 +180,24 @@ class DiskScanner:
 
         Yields:
          - Tuple[List, List]: A tuple containing lists of directories and files.
+           From a manifest, the lists of directories are empty.
         """
-        dirfilters = self.dirfilters
-        filters = self.filters
+        if self.manifest is not None:
+            groups = defaultdict(list)
+            for e in self._scan_manifest(root):
+                groups[os.path.dirname(e.path)].append(e)
+            for files in groups.values():
+                yield [], files
+            return
+        if self.workers:
+            yield from self._parallel_walk(root)
+            return
         recursive = self.recursive
         stack = [root]
         while stack:
             root = stack.pop()
-            dirs = []
-            files = []
             try:
-                with os.scandir(root) as it:
-                    for e in it:
-                        try:
-                            is_dir = e.is_dir(follow_symlinks=False)
-                        except OSError:
-                            is_dir = False
-                        if not is_dir:
-                            files.append(e)
-                        elif e.name != _EADIR:
-                            dirs.append(e)
-                    for f in dirfilters:
-                        dirs[:] = f(dirs)
-                    for f in filters:
-                        files[:] = f(files)
+                dirs, files = self._split(root)
             except OSError as e:
                 logger.error(e)
             else:
@@ -182,6 +206,257 @@ class DiskScanner:
             if not recursive:
                 break
 
+    def _scan_manifest(self, root):
+        """
+        Yield the files of the manifest under root that pass the filters, in
+        the order they are listed.
+        """
+        root = os.path.abspath(root)
+        prefix = os.path.join(root, "")
+        start = len(prefix)
+        sep = os.sep
+        match = self.match
+        dirmatch = self.dirmatch
+        recursive = self.recursive
+        for path, size, mtime in self._manifest:
+            if not os.path.isabs(path):
+                path = os.path.normpath(os.path.join(root, path))
+            elif not path.startswith(prefix):
+                continue
+            dirs = path[start:].split(sep)[:-1]
+            if dirs and (
+                not recursive
+                or _EADIR in dirs
+                or (dirmatch is not None and not all(map(dirmatch, dirs)))
+            ):
+                continue
+            e = ManifestEntry(path, size, mtime)
+            if match is None or match(e):
+                yield e
+
+    def _list(self, root, filter_dirs: bool = False):
+        """
+        List a directory, returns `(dirs, output)` where `dirs` are the
+        subdirectories to descend into and `output` the filtered files, or the
+        filtered directories if `filter_dirs` is True. Returns None on error.
+        """
+        try:
+            dirs, files = self._split(root, filter_dirs)
+        except OSError as e:
+            logger.error(e)
+            return
+        if filter_dirs:
+            match = self.match
+            files = dirs if match is None else [e for e in dirs if match(e)]
+        return dirs, files
+
+    def _split(self, root, filter_dirs: bool = False):
+        """
+        List a directory in one pass, returns the subdirectories passing the
+        directory filters, and the files passing the file filters. If
+        `filter_dirs` is True, files are not filtered.
+        """
+        match = None if filter_dirs else self.match
+        dirmatch = self.dirmatch
+        dirs = []
+        files = []
+        with os.scandir(root) as it:
+            for e in it:
+                try:
+                    is_dir = e.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    if match is None or match(e):
+                        files.append(e)
+                elif e.name != _EADIR and (dirmatch is None or dirmatch(e.name)):
+                    dirs.append(e)
+        return dirs, files
+
+    def _parallel_walk(self, root, filter_dirs: bool = False):
+        """
+        Yield the `_list` result of each directory, listing directories on a
+        thread pool.
+        """
+        ex = ThreadPoolExecutor(self.workers, thread_name_prefix="scan")
+        submit = ex.submit
+        listdir = self._list
+        recursive = self.recursive
+        pending = ()  # Listings submitted but not yet consumed
+        try:
+            if self.ordered:
+                # Depth-first like the serial scan, with subdirectories listed
+                # ahead of time
+                pending = stack = [submit(listdir, root, filter_dirs)]
+                while stack:
+                    result = stack.pop().result()
+                    if result is None:
+                        continue
+                    if recursive:
+                        fts = [submit(listdir, e.path, filter_dirs) for e in result[0]]
+                        stack.extend(reversed(fts))
+                    yield result
+            else:
+                pending = {submit(listdir, root, filter_dirs)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for ft in done:
+                        result = ft.result()
+                        if result is None:
+                            continue
+                        if recursive:
+                            pending.update(
+                                submit(listdir, e.path, filter_dirs) for e in result[0]
+                            )
+                        yield result
+        finally:
+            # If the consumer stopped early, drop the listings not started.
+            # shutdown(cancel_futures=True) would need Python 3.9.
+            for ft in pending:
+                ft.cancel()
+            ex.shutdown()
+
+
+class ManifestEntry:
+    """
+    A file listed in a manifest, standing in for os.DirEntry. Its stat result
+    has the listed size and mtime. The atime is not listed and is None, it is
+    read from the file when a new date is applied.
+    """
+
+    __slots__ = ("path", "name", "_stat")
+
+    def __init__(self, path: str, size: int, mtime: float):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = os.stat_result(
+            (stat.S_IFREG | 0o644, 0, 0, 1, 0, 0, size, None, mtime, mtime)
+        )
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"<ManifestEntry {self.path!r}>"
+
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return False
+
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        return True
+
+    def stat(self, follow_symlinks: bool = True) -> os.stat_result:
+        return self._stat
+
+
+def read_manifest(source) -> list:
+    """
+    Read a file listing, or stdin if `source` is "-", as produced by:
+
+        find . -type f -printf '%p\\t%s\\t%T@\\n'
+
+    Returns a list of `(path, size, mtime)`. Relative paths are resolved against
+    the scanned directory, so a listing made on a storage node can be used
+    where the share is mounted. Such a listing is ambiguous with several
+    directories, see `check_manifest`. Malformed lines are logged and skipped.
+    """
+    f = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    entries = []
+    with f:
+        for i, line in enumerate(f, 1):
+            try:
+                path, size, mtime = line.rstrip("\r\n").rsplit("\t", 2)
+                entries.append((path, int(size), float(mtime)))
+            except ValueError:
+                if line.strip():
+                    logger.warning("Malformed manifest line %d: %r", i, line)
+    stderr_write(f"Read {len(entries)} entries from manifest.\n")
+    return entries
+
+
+def check_manifest(scanner: DiskScanner, roots):
+    """
+    Exit if the manifest of scanner has relative paths and there are several
+    roots to resolve them against.
+    """
+    if scanner.manifest is None or not isinstance(roots, (list, tuple)):
+        return
+    if len(roots) > 1 and not all(os.path.isabs(e[0]) for e in scanner._manifest):
+        sys.exit("A manifest with relative paths can only be used with one directory.")
+
+
+def group_by_device(roots) -> list:
+    """
+    Group roots by the device they reside on (st_dev), in the given order.
+    Roots that cannot be accessed are logged and dropped.
+    """
+    groups = defaultdict(list)
+    for root in dict.fromkeys(roots):
+        try:
+            groups[os.stat(root).st_dev].append(root)
+        except OSError as e:
+            logger.error(e)
+    return list(groups.values())
+
+
+def scan_roots(roots, scan, maxsize: int = 1024) -> Generator:
+    """
+    Run a scan function, e.g. `DiskScanner.scandir`, over one or more roots and
+    yield the combined output. Roots on the same device are scanned one after
+    another by a single worker, while different devices are scanned in
+    parallel, so the idle I/O of other disks is used without thrashing one.
+    """
+    if not isinstance(roots, (list, tuple)):
+        roots = (roots,)
+    if len(roots) == 1:
+        yield from scan(roots[0])
+        return
+
+    queue = Queue(maxsize)
+    stop = Event()
+    done = object()  # Sent by each worker when it exits
+
+    def worker(group):
+        try:
+            for root in group:
+                for item in scan(root):
+                    if stop.is_set():
+                        return
+                    queue.put(item)
+        except Exception as e:
+            queue.put(_ScanError(e))
+        finally:
+            queue.put(done)
+
+    groups = group_by_device(roots)
+    for group in groups:
+        Thread(target=worker, args=(group,), daemon=True).start()
+    remaining = len(groups)
+    try:
+        while remaining:
+            item = queue.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, _ScanError):
+                raise item.error
+            else:
+                yield item
+    finally:
+        # Let workers blocked on a full queue finish
+        stop.set()
+        while remaining:
+            if queue.get() is done:
+                remaining -= 1
+
+
+class _ScanError:
+    """Carries an exception from a scan worker to the consumer."""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
 
 def get_scanner(args, exts=None):
     """
@@ -189,71 +464,288 @@ def get_scanner(args, exts=None):
 
     :type args: argparse.Namespace
     """
-    return DiskScanner(
+    scanner = DiskScanner(
         exts=exts,
         recursive=args.recursive,
         includes=args.include,
         excludes=args.exclude,
         exclude_dirs=args.exclude_dir,
         newer=args.newer,
+        workers=args.workers,
+        ordered=not args.unordered,
+        manifest=getattr(args, "manifest", None),
     )
+    check_manifest(scanner, args.source)
+    return scanner
 
 
-def update_dir_mtime(root):
+def update_dir_mtime(
+    roots, full: bool = False, workers: int = 8, manifest: str = None
+):
     """
     Update the modification times of directories based on the newest file they
-    contain.
+    contain. `roots` can be a path or a list of paths, roots on different
+    devices are processed in parallel.
+
+    The trees are compared with a snapshot from the previous run, only the
+    directories whose own mtime has changed are listed again. Files modified in
+    place do not change their directory, use `full` to list every directory.
+    With a `manifest`, the newest mtimes are computed from the listing and only
+    the directories are accessed.
     """
-    if not isinstance(root, Path):
-        root = Path(root)
+    if not isinstance(roots, (list, tuple)):
+        roots = (roots,)
+    scanner = None
+    if manifest is not None:
+        scanner = DiskScanner(manifest=manifest)
+        check_manifest(scanner, roots)
     stderr_write("Updating directory timestamps...\n")
-    _, total, updated = _update_dirtime(root)
+
+    def work(group):
+        total = updated = 0
+        with DirSnapshot() as snapshot:
+            for root in group:
+                root = os.path.abspath(root)
+                if scanner is None:
+                    t, u = _update_tree(root, snapshot, full, workers)
+                else:
+                    t, u = _update_from_manifest(root, scanner)
+                total += t
+                updated += u
+        return total, updated
+
+    groups = group_by_device(roots)
+    with ThreadPoolExecutor(max(len(groups), 1)) as ex:
+        results = list(ex.map(work, groups))
+    total = sum(r[0] for r in results)
+    updated = sum(r[1] for r in results)
     stderr_write(f"Finished. Total: {total}. Updated: {updated}.\n")
 
 
-def _update_dirtime(root, total=0, updated=0):
-    """Recursive helper function to update directory modification times."""
-    newest = 0
-    total += 1
-    dirs = []
+def _update_tree(root: str, snapshot: DirSnapshot, full: bool, workers: int):
+    """
+    Update the directories under root, returns the number of directories
+    visited and updated.
+    """
     try:
-        with os.scandir(root) as it:
-            for e in it:
-                try:
-                    is_dir = e.is_dir(follow_symlinks=False)
-                except OSError:
-                    is_dir = False
-                if not is_dir:
-                    try:
-                        mtime = e.stat().st_mtime
-                    except OSError:
-                        continue
-                    if mtime > newest:
-                        newest = mtime
-                elif e.name != _EADIR:
-                    dirs.append(e)
+        mtime = os.stat(root).st_mtime
     except OSError as e:
         logger.error(e)
-        return 0, total, updated
-    # Process subdirectories after closing the parent's file handle
-    for e in dirs:
-        mtime, total, updated = _update_dirtime(e, total, updated)
-        if mtime > newest:
-            newest = mtime
-    if newest:
+        return 0, 0
+    old = {} if full else snapshot.load(root)
+    rows, updated, _ = _refresh_tree(root, mtime, old, workers)
+    if not Config.DRYRUN:
+        snapshot.save(root, rows)
+    return len(rows), updated
+
+
+def _refresh_tree(top: str, mtime: float, old: dict, workers: int, parent=None):
+    """
+    Update the directories under top, whose mtime is given, against the
+    snapshot nodes `old`. The tree is walked top-down on a thread pool, then
+    the newest mtimes are propagated bottom-up. Returns the snapshot rows of
+    the tree, with `parent` as the parent of top, the number of directories
+    updated and the newest mtime of the files under top.
+    """
+
+    def visit(path: str, mtime: float):
+        """
+        Returns the newest mtime of the files directly in path, and its
+        subdirectories with their mtimes.
+        """
+        node = old.get(path)
+        if node is not None and node[0] == mtime:
+            # Same entries as in the snapshot, only the subdirs may have changed
+            children = []
+            for child in node[2]:
+                try:
+                    children.append((child, os.lstat(child).st_mtime))
+                except OSError as e:
+                    logger.error(e)
+            return node[1], children
+        return _list_dir(path)
+
+    nodes = {}  # path -> (mtime, local, children), parents before children
+    with ThreadPoolExecutor(workers) as ex:
+        pending = {ex.submit(visit, top, mtime): (top, mtime)}
+        while pending:
+            done = wait(pending, return_when=FIRST_COMPLETED)[0]
+            for ft in done:
+                path, mtime = pending.pop(ft)
+                try:
+                    local, children = ft.result()
+                except OSError as e:
+                    logger.error(e)
+                    continue
+                nodes[path] = (mtime, local, [c[0] for c in children])
+                for c in children:
+                    pending[ex.submit(visit, *c)] = c
+
+    updated = 0
+    newest = {}
+    rows = []
+    for path in reversed(nodes):
+        mtime, local, children = nodes[path]
+        n = max(local, max((newest.get(c, 0) for c in children), default=0))
+        newest[path] = n
+        if n and n != mtime:
+            try:
+                if not Config.DRYRUN:
+                    os.utime(path, (os.stat(path).st_atime, n))
+                updated += 1
+                stderr_write(f"{strftime(mtime)} => {strftime(n)}: {path}\n")
+                mtime = n
+            except OSError as e:
+                logger.error(e)
+        p = parent if path == top else os.path.dirname(path)
+        rows.append((path, p, mtime, local))
+    return rows, updated, newest.get(top, 0)
+
+
+def _list_dir(path: str):
+    """
+    List a directory, returns the newest mtime of the files directly in it, and
+    its subdirectories with their mtimes. Symlinks are followed for files only.
+    """
+    local = 0
+    children = []
+    with os.scandir(path) as it:
+        for e in it:
+            try:
+                is_dir = e.is_dir(follow_symlinks=False)
+                st = e.stat(follow_symlinks=not is_dir)
+            except OSError:
+                continue
+            if not is_dir:
+                if st.st_mtime > local:
+                    local = st.st_mtime
+            elif e.name != _EADIR:
+                children.append((e.path, st.st_mtime))
+    return local, children
+
+
+def _update_from_manifest(root: str, scanner: DiskScanner):
+    """
+    Update the directories under root from the files of a manifest, returns
+    the number of directories with files and updated.
+    """
+    newest = {}
+    for e in scanner.scandir(root):
+        mtime = e.stat().st_mtime
+        d = os.path.dirname(e.path)
+        # Ancestors are never older than their descendants
+        while newest.get(d, 0) < mtime:
+            newest[d] = mtime
+            if d == root:
+                break
+            d = os.path.dirname(d)
+    sep = os.sep
+    updated = 0
+    for d in sorted(newest, key=lambda d: d.count(sep), reverse=True):
+        n = newest[d]
         try:
-            stat = root.stat()
-            if newest != stat.st_mtime:
+            st = os.stat(d)
+            if n != st.st_mtime:
                 if not Config.DRYRUN:
-                    os.utime(root, (stat.st_atime, newest))
+                    os.utime(d, (st.st_atime, n))
                 updated += 1
-                stderr_write(
-                    "{} => {}: {}\n".format(
-                        strftime(stat.st_mtime),
-                        strftime(newest),
-                        os.fspath(root),
-                    )
-                )
+                stderr_write(f"{strftime(st.st_mtime)} => {strftime(n)}: {d}\n")
         except OSError as e:
             logger.error(e)
-    return newest, total, updated
+    return len(newest), updated
+
+
+def update_parents(path, root, snapshot: DirSnapshot = None) -> int:
+    """
+    Update the modification times of the directories from the parent of `path`
+    up to `root`, bottom-up, after files under them have changed. Returns the
+    number of directories updated.
+    """
+    return update_ancestors((os.path.dirname(path),), (root,), snapshot)
+
+
+def update_ancestors(
+    dirs, roots, snapshot: DirSnapshot = None, workers: int = 8
+) -> int:
+    """
+    Update the modification times of directories and their ancestors up to the
+    root containing them, bottom-up, after files in them have changed.
+    Directories outside of the roots are ignored. Returns the number of
+    directories updated.
+
+    Only the directories of the chains are listed. Other subdirectories are
+    trusted if their mtime matches the snapshot of the last `dir` run, or if
+    their tree has never been snapshotted. Those changed or created since are
+    walked against the snapshot like in `update_dir_mtime`. The results are
+    written back to the snapshot, so the next update starts from them.
+    """
+    # Outermost first, so a directory is matched to the root of its whole chain
+    roots = sorted(map(os.path.abspath, roots), key=len)
+    chain = set()
+    for d in dirs:
+        d = os.path.abspath(d)
+        for root in roots:
+            if d == root or d.startswith(os.path.join(root, "")):
+                break
+        else:
+            continue
+        while d not in chain:
+            chain.add(d)
+            if d == root:
+                break
+            d = os.path.dirname(d)
+    if not chain:
+        return 0
+    if snapshot is None:
+        with DirSnapshot() as snapshot:
+            return update_ancestors(chain, roots, snapshot, workers)
+
+    sep = os.sep
+    newest = {}  # path -> newest mtime of the files under it
+    updated = 0
+    for path in sorted(chain, key=lambda d: d.count(sep), reverse=True):
+        try:
+            local, children = _list_dir(path)
+            st = os.stat(path)
+        except OSError as e:
+            logger.error(e)
+            continue
+        this = snapshot.lookup(path)
+        n = local
+        for child, mtime in children:
+            if child in newest:
+                mtime = newest[child]
+            else:
+                record = snapshot.lookup(child)
+                if record is None and this is not None:
+                    # Created since the snapshot
+                    record = (this[0], None)
+                if record is not None and record[1] != mtime:
+                    # Changed since the snapshot, walk it against the snapshot
+                    old = snapshot.load(record[0], child)
+                    rows, u, mtime = _refresh_tree(
+                        child, mtime, old, workers, path
+                    )
+                    updated += u
+                    if not Config.DRYRUN:
+                        snapshot.save(record[0], rows, child)
+            if mtime > n:
+                n = mtime
+        newest[path] = n
+        mtime = st.st_mtime
+        if n and n != mtime:
+            try:
+                if not Config.DRYRUN:
+                    os.utime(path, (st.st_atime, n))
+                logger.debug("Update directory mtime: %s", path)
+                updated += 1
+                mtime = n
+            except OSError as e:
+                logger.error(e)
+        if this is not None and not Config.DRYRUN:
+            root = this[0]
+            parent = None if path == root else os.path.dirname(path)
+            snapshot.save_dir(
+                root, (path, parent, mtime, local), (c[0] for c in children)
+            )
+    return updated
@@ -11,7 +11,14 @@ from urllib.parse import quote, urljoin
 
 from .files import DiskScanner, get_scanner
 from .network import HtmlElement, get_tree, xpath
-from .utils import AVInfo, Status, date_searcher, dryrun_method, re_search, re_sub
+from .utils import (
+    AVInfo,
+    Record,
+    Status,
+    date_searcher,
+    re_search,
+    re_sub,
+)
 
 is_cjk_name = r"(?=\w*?[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7a3])(\w{2,20})"
 name_finder = re.compile(
@@ -419,10 +426,11 @@ class IdolFolder(Idol):
         if self.status == Status.SUCCESS and self.final != path.name:
             self.status = Status.UPDATED
 
-    @dryrun_method
-    def apply(self):
+    def to_record(self) -> Record:
+        newpath = None
         if self.status == Status.UPDATED:
-            os.rename(self.path, self.path.with_name(self.final))
+            newpath = os.fspath(self.path.with_name(self.final))
+        return Record(self.status, self.report, os.fspath(self.path), newpath)
 
 
 def from_dir(root, scanner: DiskScanner = None) -> Generator[IdolFolder, None, None]:
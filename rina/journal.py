@@ -0,0 +1,201 @@
+"""
+Applies file changes in directory batches, with an append-only journal.
+
+Changes are grouped by parent directory. Each directory is opened once and its
+renames and timestamp updates are made relative to the directory descriptor,
+where the platform supports it. Directories are processed in parallel on a
+bounded pool. Every completed operation is appended to a JSONL journal, so an
+interrupted run can be resumed, and a finished one rolled back.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from itertools import islice
+from pathlib import Path
+from threading import Lock
+
+from .utils import Config, Record, data_path, thread_map
+
+logger = logging.getLogger(__name__)
+
+_DIR_FD = {os.rename, os.stat, os.utime}.issubset(os.supports_dir_fd)
+_O_DIRECTORY = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)
+
+
+class Journal:
+    """
+    An append-only log of completed file operations, one JSON object per line:
+
+     - {"op": "rename", "path": <original>, "newpath": <new>}
+     - {"op": "utime", "path": <original>, "target": <current>,
+        "old": [atime, mtime], "new": [atime, mtime]}
+
+    If `resume` is True, operations already in the file are marked done.
+    """
+
+    def __init__(self, path=None, resume: bool = False):
+        self.path = new_journal_path() if path is None else Path(path)
+        self.done = set()
+        if resume and self.path.exists():
+            for entry in read_journal(self.path):
+                self.done.add((entry["op"], entry["path"]))
+            logger.info("Resume from '%s': %s done.", self.path, len(self.done))
+        self._f = open(self.path, "a", encoding="utf-8")
+        self._lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_done(self, op: str, path: str) -> bool:
+        return (op, path) in self.done
+
+    def write(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def new_journal_path(name: str = None) -> Path:
+    """
+    Returns a journal path in the data directory, named `name` or else by the
+    current time.
+    """
+    d = data_path("journals")
+    d.mkdir(exist_ok=True)
+    return d.joinpath(name or time.strftime("%Y%m%d-%H%M%S.jsonl"))
+
+
+def latest_journal() -> Path:
+    """Returns the most recent journal that has not been rolled back."""
+    d = data_path("journals")
+    journals = sorted(d.glob("*.jsonl")) if d.is_dir() else None
+    if not journals:
+        raise FileNotFoundError(f"No journal found in '{d}'.")
+    return journals[-1]
+
+
+def read_journal(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption
+                logger.warning("Skip malformed journal line: %r", line)
+
+
+def apply_records(records, journal: Journal, max_workers: int = None):
+    """
+    Apply the changes of records, yielding `(record, error)` for each of them
+    as its directory is done. `error` is None on success. Records are grouped
+    by directory within batches, so the input is consumed lazily.
+    """
+    if Config.DRYRUN:
+        for r in records:
+            yield r, None
+        return
+
+    def work(group):
+        return _apply_dir(*group, journal)
+
+    for _, results in thread_map(work, _group_by_dir(records), max_workers):
+        yield from results
+
+
+def _group_by_dir(records, batchsize: int = 1024):
+    it = iter(records)
+    while True:
+        groups = defaultdict(list)
+        for r in islice(it, batchsize):
+            groups[os.path.dirname(r.path)].append(r)
+        if not groups:
+            return
+        yield from groups.items()
+
+
+def _apply_dir(parent: str, records: list, journal: Journal) -> list:
+    fd = None
+    if _DIR_FD:
+        try:
+            fd = os.open(parent, _O_DIRECTORY)
+        except OSError as e:
+            logger.debug("Cannot open directory '%s': %s", parent, e)
+    results = []
+    try:
+        for r in records:
+            try:
+                _apply_record(r, parent, fd, journal)
+            except OSError as e:
+                results.append((r, e))
+            else:
+                results.append((r, None))
+    finally:
+        if fd is not None:
+            os.close(fd)
+    return results
+
+
+def _apply_record(r: Record, parent: str, fd: int, journal: Journal):
+    target = r.path
+    if r.newpath:
+        if not journal.is_done("rename", r.path):
+            src, src_fd = _at(r.path, parent, fd)
+            dst, dst_fd = _at(r.newpath, parent, fd)
+            os.rename(src, dst, src_dir_fd=src_fd, dst_dir_fd=dst_fd)
+            journal.write({"op": "rename", "path": r.path, "newpath": r.newpath})
+        target = r.newpath
+    if r.newdate and not journal.is_done("utime", r.path):
+        name, dir_fd = _at(target, parent, fd)
+        st = os.stat(name, dir_fd=dir_fd)
+        atime, mtime = r.newdate
+        if atime is None:
+            atime = st.st_atime
+        os.utime(name, (atime, mtime), dir_fd=dir_fd)
+        journal.write(
+            {
+                "op": "utime",
+                "path": r.path,
+                "target": target,
+                "old": [st.st_atime, st.st_mtime],
+                "new": [atime, mtime],
+            }
+        )
+
+
+def _at(path: str, parent: str, fd: int):
+    """Returns `(name, dir_fd)` addressing a path relative to an open directory."""
+    if fd is not None and os.path.dirname(path) == parent:
+        return os.path.basename(path), fd
+    return path, None
+
+
+def rollback(path) -> list:
+    """
+    Undo the operations of a journal in reverse order. Returns a list of
+    errors. The journal is marked as rolled back if all of them are undone.
+    """
+    path = Path(path)
+    errors = []
+    for entry in reversed(list(read_journal(path))):
+        if Config.DRYRUN:
+            continue
+        try:
+            if entry["op"] == "rename":
+                os.rename(entry["newpath"], entry["path"])
+            else:
+                os.utime(entry["target"], tuple(entry["old"]))
+        except OSError as e:
+            errors.append(e)
+    if not (errors or Config.DRYRUN):
+        path.rename(path.with_suffix(".rolledback"))
+    return errors
@@ -2,15 +2,22 @@
 Functionalities for making HTTP requests and parsing HTML content.
 
 - get: Perform a GET request with site-specific settings and a managed session.
+- get_response: Perform a GET request, returning the response only if it
+  succeeded.
 - get_tree: Retrieve and parse the HTML content of a web page into an
   HtmlElement.
+- probe: Fetch URL variants concurrently and keep the highest-priority hit.
+- set_mirrors: Route a site's requests to the fastest of its healthy mirrors.
+- ErrorTracker: Tell whether requests failed, as opposed to finding nothing.
 """
 
 import json
 import logging
 import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import lru_cache
-from threading import Semaphore
+from threading import Lock, Semaphore, local
 from typing import Optional, Tuple
 from urllib.parse import ParseResult, urlparse
 
@@ -19,19 +26,24 @@ import urllib3
 from lxml.etree import XPath
 from lxml.html import HtmlElement, HTMLParser
 from lxml.html import fromstring as html_fromstring
+from requests import Response
 from requests.exceptions import HTTPError, RequestException
 
-from .utils import join_root
+from .utils import first_hit, join_root
 
 logger = logging.getLogger(__name__)
 
 HTTP_TIMEOUT = (9.1, 60)  # (connect, read)
+NOT_FOUND = frozenset((404, 410))  # Statuses that are an answer, not a failure
+MIRROR_COOLDOWN = 300  # Seconds before retrying a failed mirror
 DEFAULT_SETTING = {
     "max_connection": 5,
     "cookies": None,
     "headers": None,
     "encoding": None,
+    "mirrors": (),
 }
+# "mirrors" lists alternative domains of a site, see set_mirrors
 SITE_SETTINGS = {
     "www.javbus.com": {
         "max_connection": 10,
@@ -122,40 +134,216 @@ def _init_site(netloc: str) -> Tuple[dict, Semaphore]:
     return setting, Semaphore(setting["max_connection"])
 
 
+def _get_site(netloc: str) -> Tuple[dict, Semaphore]:
+    """Returns the cached settings and semaphore for a domain."""
+    try:
+        return _settings[netloc]
+    except KeyError:
+        result = _settings[netloc] = _init_site(netloc)
+        return result
+
+
 _settings = {}  # Cached site settings
 
 
+class _MirrorGroup:
+    """
+    A group of mirror domains serving the same site. Each mirror keeps its own
+    connection limit, so the capacity of the group is the sum of them.
+    """
+
+    def __init__(self, netlocs: tuple):
+        self.netlocs = netlocs
+        self.latency = dict.fromkeys(netlocs, 0.0)
+        self.down = {}  # netloc -> time of failure
+        self._probed = False
+        self._lock = Lock()
+
+    def _probe(self, scheme: str):
+        """Measures the latency and availability of every mirror, once."""
+        with self._lock:
+            if self._probed:
+                return
+
+            def head(netloc):
+                _get_site(netloc)  # Set the site's cookies
+                start = time.monotonic()
+                try:
+                    session.head(f"{scheme}://{netloc}/", timeout=HTTP_TIMEOUT[0])
+                except RequestException as e:
+                    logger.warning("Mirror '%s' is unavailable: %s", netloc, e)
+                    self.down[netloc] = time.monotonic()
+                else:
+                    self.latency[netloc] = time.monotonic() - start
+
+            with ThreadPoolExecutor(len(self.netlocs)) as ex:
+                ex.map(head, self.netlocs)
+            logger.debug("Mirror latency: %s", self.latency)
+            self._probed = True
+
+    def _acquire(self, exclude: set) -> Tuple[str, Semaphore]:
+        """
+        Selects the fastest healthy mirror with a free connection. If all of
+        them are busy, waits on the fastest one.
+        """
+        now = time.monotonic()
+        down = self.down
+        candidates = [n for n in self.netlocs if n not in exclude]
+        healthy = [
+            n
+            for n in candidates
+            if n not in down or now - down[n] >= MIRROR_COOLDOWN
+        ]
+        candidates = sorted(healthy or candidates, key=self.latency.get)
+        for netloc in candidates:
+            semaphore = _get_site(netloc)[1]
+            if semaphore.acquire(blocking=False):
+                return netloc, semaphore
+        netloc = candidates[0]
+        semaphore = _get_site(netloc)[1]
+        semaphore.acquire()
+        return netloc, semaphore
+
+    def get(self, pr: ParseResult, **kwargs):
+        """
+        Sends a request to the best mirror, failing over to the others on
+        connection errors.
+        """
+        if not self._probed:
+            self._probe(pr.scheme)
+        tried = set()
+        while True:
+            netloc, semaphore = self._acquire(tried)
+            mpr = pr._replace(netloc=netloc)
+            try:
+                response = _request(mpr.geturl(), mpr, _get_site(netloc)[0], kwargs)
+            except RequestException:
+                self.down[netloc] = time.monotonic()
+                tried.add(netloc)
+                if len(tried) == len(self.netlocs):
+                    raise
+                logger.debug("Mirror '%s' failed, switching mirrors.", netloc)
+                continue
+            finally:
+                semaphore.release()
+            self.down.pop(netloc, None)
+            # Exponential moving average of the response time
+            elapsed = response.elapsed.total_seconds()
+            self.latency[netloc] = 0.8 * self.latency[netloc] + 0.2 * elapsed
+            return response
+
+
+_mirrors = {}  # netloc -> _MirrorGroup
+_local = local()
+
+
+class ErrorTracker:
+    """
+    A context manager recording whether any request made in its block failed
+    for a reason other than the page not existing. Tasks submitted to the
+    network pool from the block are tracked as well.
+    """
+
+    def __init__(self):
+        self.failed = False
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(_local, "tracker", None)
+        _local.tracker = self
+        return self
+
+    def __exit__(self, *args):
+        _local.tracker = self._outer
+
+
+def note_error():
+    """Marks the active error trackers of this thread as failed."""
+    tracker = getattr(_local, "tracker", None)
+    while tracker is not None:
+        tracker.failed = True
+        tracker = tracker._outer
+
+
+def _bind(fn):
+    """Wraps fn to run under the error tracker of the calling thread."""
+    tracker = getattr(_local, "tracker", None)
+    if tracker is None:
+        return fn
+
+    def run(*args, **kwargs):
+        outer = getattr(_local, "tracker", None)
+        _local.tracker = tracker
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.tracker = outer
+
+    return run
+
+
+def set_mirrors(name: str, *mirrors: str):
+    """
+    Declares mirror domains for a site. Requests to the site or any of its
+    mirrors are sent to the fastest healthy mirror. The mirrors share the
+    site's settings.
+    """
+    if name in SITE_SETTINGS:
+        for m in mirrors:
+            set_alias(m, name)
+    group = _MirrorGroup((name, *mirrors))
+    for netloc in group.netlocs:
+        _mirrors[netloc] = group
+
+
+def _init_mirrors():
+    """Registers the mirror groups declared in SITE_SETTINGS."""
+    for name, setting in tuple(SITE_SETTINGS.items()):
+        if setting.get("mirrors") and name not in _mirrors:
+            set_mirrors(name, *setting["mirrors"])
+
+
 def get(url: str, *, pr: ParseResult = None, **kwargs):
     """
-    Performs a GET request with site-specific settings.
+    Performs a GET request with site-specific settings. Requests to a site
+    with mirrors are routed to the best mirror. Connection errors and error
+    statuses other than NOT_FOUND are noted to the active error trackers.
     """
     logger.debug("GET: %s", url)
     if pr is None:
         pr = urlparse(url)
+    group = _mirrors.get(pr.netloc)
     try:
-        setting, semaphore = _settings[pr.netloc]
-    except KeyError:
-        setting, semaphore = _settings[pr.netloc] = _init_site(pr.netloc)
+        if group is not None:
+            response = group.get(pr, **kwargs)
+        else:
+            setting, semaphore = _get_site(pr.netloc)
+            with semaphore:
+                response = _request(url, pr, setting, kwargs)
+    except RequestException:
+        note_error()
+        raise
+    if response.status_code >= 400 and response.status_code not in NOT_FOUND:
+        note_error()
+    return response
+
 
+def _request(url: str, pr: ParseResult, setting: dict, kwargs: dict):
     headers = setting["headers"]
     headers = headers.copy() if headers else {}
     headers.setdefault("Referer", f"{pr.scheme}://{pr.netloc}/")
-
-    with semaphore:
-        return session.get(
-            url,
-            headers=headers,
-            timeout=HTTP_TIMEOUT,
-            **kwargs,
-        )
-
-
-_parsers = {}  # Cached HTML parsers
+    return session.get(
+        url,
+        headers=headers,
+        timeout=HTTP_TIMEOUT,
+        **kwargs,
+    )
 
 
-def get_tree(url: str, **kwargs) -> Optional[HtmlElement]:
+def get_response(url: str, **kwargs) -> Optional[Response]:
     """
-    Fetches a web page and returns its parsed HTML tree.
+    Performs a GET request and returns the response, or None if the request
+    failed. The site-specific encoding, if any, is applied to the response.
     """
     pr = urlparse(url)
     try:
@@ -167,11 +355,29 @@ def get_tree(url: str, **kwargs) -> Optional[HtmlElement]:
     except RequestException as e:
         logger.warning(e)
         return
-    encoding = (
-        _settings[pr.netloc][0]["encoding"]
-        or response.encoding
-        or response.apparent_encoding
-    ).lower()
+    encoding = _get_site(pr.netloc)[0]["encoding"]
+    if encoding:
+        response.encoding = encoding
+    return response
+
+
+_parsers = {}  # Cached HTML parsers
+
+
+def get_tree(url: str, **kwargs) -> Optional[HtmlElement]:
+    """
+    Fetches a web page and returns its parsed HTML tree.
+    """
+    response = get_response(url, **kwargs)
+    if response is not None:
+        return parse_tree(response)
+
+
+def parse_tree(response: Response) -> HtmlElement:
+    """
+    Parses the content of a response into an HTML tree.
+    """
+    encoding = (response.encoding or response.apparent_encoding).lower()
     try:
         parser = _parsers[encoding]
     except KeyError:
@@ -183,5 +389,26 @@ def get_tree(url: str, **kwargs) -> Optional[HtmlElement]:
     return html_fromstring(response.content, base_url=response.url, parser=parser)
 
 
+def submit(fn, *args, **kwargs) -> Future:
+    """
+    Runs a request function on the shared network pool. Connections are still
+    limited per site. The function must not wait on other submitted tasks.
+    """
+    return _executor.submit(_bind(fn), *args, **kwargs)
+
+
+def probe(*urls: str, fetch=get_tree):
+    """
+    Fetches URL variants concurrently and returns `(index, result)` of the
+    first URL, in the order given, for which `fetch` returns a result. Requests
+    not yet started are cancelled once the outcome is decided. Returns `(None,
+    None)` if all variants miss.
+    """
+    fetch = _bind(fetch)
+    return first_hit([_executor.submit(fetch, url) for url in urls])
+
+
 session = _init_session()
+_init_mirrors()
+_executor = ThreadPoolExecutor(16, thread_name_prefix="network")
 xpath = lru_cache(XPath)  # Cached XPath function
@@ -0,0 +1,144 @@
+"""
+Scan plans: the changes computed by a scan, saved to replay them later without
+scraping again.
+
+A plan is a JSON Lines file. The first line is a header, each following line
+is one change with the size and mtime of its sources at planning time:
+
+ - {"op": "file", "path": ..., "newpath": ..., "newdate": [atime, mtime],
+    "size": [...], "mtime": [...]}
+ - {"op": "concat", "source": [...], "output": ..., "size": [...],
+    "mtime": [...]}
+
+An atime of null in "newdate" keeps the current atime of the file, manifests
+do not list it.
+
+When a plan is applied, changes whose sources have been modified since are
+skipped. Renames and timestamp updates go through a journal next to the plan,
+so an interrupted apply resumes where it stopped when run again.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from .journal import Journal, apply_records
+from .utils import Config, Record, Status, stderr_write
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+
+def save_plan(path, items, command: str) -> int:
+    """
+    Write the changes of items, which have a `to_plan` method, to a plan file.
+    Returns the number of changes written.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        write = f.write
+        dumps = json.JSONEncoder(ensure_ascii=False).encode
+        write(
+            dumps({"version": PLAN_VERSION, "command": command, "time": time.time()})
+            + "\n"
+        )
+        for item in items:
+            entry = item.to_plan()
+            try:
+                stats = [os.stat(p) for p in _sources(entry)]
+            except OSError as e:
+                logger.error(e)
+                continue
+            entry["size"] = [st.st_size for st in stats]
+            entry["mtime"] = [st.st_mtime for st in stats]
+            write(dumps(entry) + "\n")
+            count += 1
+    stderr_write(f"Saved {count} changes to plan: {path}\n")
+    return count
+
+
+def read_plan(path):
+    """Yield the changes of a plan file."""
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version: {header.get('version')}")
+        for line in f:
+            yield json.loads(line)
+
+
+def _sources(entry: dict) -> list:
+    return entry["source"] if entry["op"] == "concat" else [entry["path"]]
+
+
+def _is_unchanged(entry: dict, journal: Journal = None) -> bool:
+    """
+    Check that the sources of a change still have their planned size and mtime.
+    Operations already in the journal, if any, are taken into account.
+    """
+    sources = _sources(entry)
+    check_mtime = True
+    if entry["op"] == "file" and journal is not None:
+        if journal.is_done("rename", entry["path"]):
+            sources = [entry["newpath"]]
+        check_mtime = not journal.is_done("utime", entry["path"])
+    for p, size, mtime in zip(sources, entry["size"], entry["mtime"]):
+        try:
+            st = os.stat(p)
+        except OSError:
+            return False
+        if st.st_size != size or (check_mtime and st.st_mtime != mtime):
+            return False
+    return True
+
+
+def apply_plan(path, ffmpeg: str = None):
+    """Verify and apply the changes of a plan file."""
+    path = Path(path)
+    concats = []
+    planned = stale = 0
+
+    def records():
+        # Entries are read lazily, concatenations are done after the renames
+        nonlocal planned, stale
+        for entry in read_plan(path):
+            planned += 1
+            if not _is_unchanged(entry, journal):
+                stderr_write(f"Changed since planned, skip: {_sources(entry)[0]}\n")
+                stale += 1
+            elif entry["op"] == "concat":
+                concats.append(entry)
+            else:
+                newdate = entry["newdate"]
+                yield Record(
+                    Status.UPDATED,
+                    "",
+                    entry["path"],
+                    entry["newpath"],
+                    newdate and tuple(newdate),
+                )
+
+    journal = None if Config.DRYRUN else Journal(path.with_suffix(".journal"), True)
+    try:
+        errors = [e for _, e in apply_records(records(), journal) if e is not None]
+    finally:
+        if journal is not None:
+            journal.close()
+
+    if concats:
+        from .concat import _find_ffmpeg, concat_files
+
+        ffmpeg = _find_ffmpeg(ffmpeg)[0]
+        for entry in concats:
+            if not concat_files(entry["source"], Path(entry["output"]), ffmpeg):
+                errors.append(entry["output"])
+
+    for e in errors:
+        stderr_write(f"Failed to process file: {e}\n")
+    stderr_write(
+        f"Plan applied. Total: {planned}. Skipped: {stale}. "
+        f"Failure: {len(errors)}.\n"
+    )
@@ -0,0 +1,119 @@
+"""
+Checkpoints of scan results, so an interrupted scan can be resumed.
+
+Each result is appended to a run file as a JSON line as soon as it completes.
+When a scan is resumed from a run file, files already in it are skipped and
+their results are merged into the final change set. The changes are journaled
+under the name of the run file, so an interrupted apply is resumed as well.
+Run files left by interrupted scans are removed once they have not been
+written to for MAX_AGE seconds.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from .utils import Record, Status, data_path
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE = 7 * 86400  # Seconds to keep the run file of an interrupted scan
+
+
+class RunFile:
+    """
+    A JSON Lines file of scan results. If `path` is None, a new file is
+    created in the data directory.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            d = data_path("runs")
+            d.mkdir(exist_ok=True)
+            prune(d)
+            path = d.joinpath(time.strftime("%Y%m%d-%H%M%S.jsonl"))
+        self.path = Path(path)
+        self.done = set()
+        self._end = 0
+        if self.path.exists():
+            for r in self._read():
+                self.done.add(r.path)
+                if r.newpath:
+                    # Renamed if the changes were partly applied
+                    self.done.add(r.newpath)
+            self._end = self.path.stat().st_size
+        self._f = open(self.path, "a", encoding="utf-8")
+        if self._end and not self._ends_with_newline():
+            # Terminate a line cut short by an interruption
+            self._f.write("\n")
+        self._encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _read(self, end: int = None):
+        pos = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                pos += len(line)
+                if end is not None and pos > end:
+                    return
+                try:
+                    d = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interruption
+                    continue
+                d["status"] = Status[d["status"]]
+                if d["newdate"]:
+                    d["newdate"] = tuple(d["newdate"])
+                yield Record(**d)
+
+    def records(self):
+        """Yield the results that were in the file when it was opened."""
+        if self._end:
+            yield from self._read(self._end)
+
+    def track(self, stream):
+        """
+        Pass AVInfo objects through, appending their results to the file.
+        Errors are not recorded, so they are retried on resume.
+        """
+        write = self._f.write
+        encode = self._encode
+        for obj in stream:
+            if obj.status != Status.ERROR:
+                r = obj.to_record()
+                write(encode({**r._asdict(), "status": r.status.name}) + "\n")
+                self._f.flush()
+            yield obj
+
+    def close(self, remove: bool = False):
+        self._f.close()
+        if remove:
+            try:
+                os.unlink(self.path)
+            except OSError as e:
+                logger.warning(e)
+
+
+def prune(directory, max_age: float = MAX_AGE) -> int:
+    """
+    Remove the run files in directory not modified for max_age seconds.
+    Returns the number of files removed.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in Path(directory).glob("*.jsonl"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError as e:
+            logger.warning(e)
+    if removed:
+        logger.info("Removed %s stale run files.", removed)
+    return removed
@@ -1,14 +1,37 @@
+import atexit
 import datetime
 import json
 import logging
+import os
 import re
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from threading import Lock
 from typing import Optional
 
 from . import network
-from .network import get, get_tree, html_fromstring, xpath
-from .utils import join_root, re_search, re_sub, str_to_epoch, strptime, two_digit_regex
+from .network import (
+    get,
+    get_response,
+    get_tree,
+    html_fromstring,
+    parse_tree,
+    probe,
+    xpath,
+)
+from .utils import (
+    Config,
+    data_path,
+    first_hit,
+    join_root,
+    process_map,
+    re_search,
+    re_sub,
+    str_to_epoch,
+    strptime,
+    two_digit_regex,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +39,8 @@ logger = logging.getLogger(__name__)
 REG_Y = two_digit_regex(0, datetime.date.today().year % 100)
 REG_M = r"0[1-9]|1[0-2]"
 REG_D = r"[12][0-9]|0[1-9]|3[01]"
+OFFLINE_SOURCE = "offline"
+MAX_CANDIDATES = 4
 _subspace = re.compile(r"\s+").sub
 _subdash = re.compile(r"[-_+]+").sub
 _subbraces = re.compile(r"[\s()\[\].-]+").sub
@@ -53,6 +78,7 @@ class Scraper(ABC):
         self.string = match.string
 
     def search(self):
+        self._set_id()
         for func in self._search, self._javbus, self._javdb:
             result = func()
             if result:
@@ -67,19 +93,45 @@ class Scraper(ABC):
                     result.pub_date = str_to_epoch(result.pub_date)
                     return result
 
-    def _search(self) -> Optional[ScrapeResult]:
+    def extract(self) -> ScrapeResult:
+        """Build the product ID from the match alone, without network access."""
+        self._set_id()
+        return ScrapeResult(
+            product_id=self._add_suffix(self.search_id),
+            source=OFFLINE_SOURCE,
+        )
+
+    def _set_id(self) -> None:
         """
-        Abstract method to be implemented by subclasses:
-         - Set `self.search_id`
-         - Conduct site-specific searches
+        Abstract method to be implemented by subclasses: set `self.search_id`
+        from `self.match`. Must not access the network.
         """
         raise NotImplementedError
 
+    def _search(self) -> Optional[ScrapeResult]:
+        """
+        Conduct site-specific searches. Scrapers without a dedicated source rely
+        on JavBus and JavDB.
+        """
+
     def _javbus(self):
+        if self.uncensored:
+            return self._search_javbus()
+        # Fetch the censored search alongside, it is used on a miss
+        censored = network.submit(
+            get_tree, f"https://www.javbus.com/search/{self.search_id}"
+        )
+        try:
+            return self._search_javbus(censored)
+        finally:
+            censored.cancel()
+
+    def _search_javbus(self, censored: network.Future = None):
         try:
             res = get(f"https://www.javbus.com/uncensored/search/{self.search_id}")
             if "member.php?mod=logging" in res.url:
                 logger.warning("JavBus is walled, consider switching network.")
+                network.note_error()
                 return
             res.raise_for_status()
             http_ok = True
@@ -103,7 +155,7 @@ class Scraper(ABC):
         if re_search(r"/\s*0+\s*\)", result):
             return
 
-        tree = get_tree(f"https://www.javbus.com/search/{self.search_id}")
+        tree = censored.result()
         if tree is not None:
             return self._parse_javbus(tree)
 
@@ -201,33 +253,56 @@ class StudioScraper(Scraper):
     studio: str = None
 
     def search(self):
+        result = super().search()
+        if result and (result.source.startswith("jav") or not result.pub_date):
+            # Keep the scraped date if the one in the ID is invalid
+            date = self._parse_date()
+            if date is not None:
+                result.pub_date = date
+        return result
+
+    def extract(self):
+        result = super().extract()
+        result.pub_date = self._parse_date()
+        return result
+
+    def _set_id(self):
         match = self.match
         self.search_id = f'{match["s1"]}_{match["s2"]}'
 
         m = self.studio_match = re_search(self._std_re, self.string)
         if m:
-            self._search = getattr(self, m.lastgroup)
+            studio = m.lastgroup
         elif match["s3"] and match["s4"]:
-            self._search = self._mesubuta
+            studio = "_mesubuta"
+        else:
+            return
+        self._set_studio(studio[1:])
+        self._search = getattr(self, studio)
 
-        result = super().search()
+    def _set_studio(self, studio: str):
+        """Apply the studio-specific ID format, which needs no network."""
+        self.studio = studio
+        if studio == "carib":
+            self.search_id = self.search_id.replace("_", "-")
+        elif studio == "mesubuta":
+            self.datefmt = "%y%m%d"
+            if self.match["s3"]:
+                self.search_id = "_".join(self.match.group("s1", "s2", "s3"))
 
-        if result and (result.source.startswith("jav") or not result.pub_date):
-            try:
-                result.pub_date = strptime(match["s1"], self.datefmt)
-            except ValueError as e:
-                self.warning(e)
-        return result
+    def _parse_date(self) -> Optional[float]:
+        """Derive the release date from the date part of the ID."""
+        try:
+            return strptime(self.match["s1"], self.datefmt)
+        except ValueError as e:
+            self.warning(e)
 
     def _search(self) -> Optional[ScrapeResult]:
-        tree = get_tree(f"https://www.javbus.com/{self.search_id}")
-
+        search_ids = (self.search_id, self.search_id.replace("_", "-"))
+        i, tree = probe(*(f"https://www.javbus.com/{i}" for i in search_ids))
         if tree is None:
-            search_id = self.search_id.replace("_", "-")
-            tree = get_tree(f"https://www.javbus.com/{search_id}")
-            if tree is None:
-                return
-            self.search_id = search_id
+            return
+        self.search_id = search_ids[i]
 
         tree = tree.find('.//div[@class="container"]')
         try:
@@ -274,8 +349,7 @@ class StudioScraper(Scraper):
 
     def _carib(self, url: str = None, source: str = None):
         if not url:
-            self.studio = "carib"
-            self.search_id = self.search_id.replace("_", "-")
+            self._set_studio("carib")
             source = "caribbeancom.com"
             url = "https://www.caribbeancom.com"
 
@@ -304,7 +378,7 @@ class StudioScraper(Scraper):
         )
 
     def _caribpr(self):
-        self.studio = "caribpr"
+        self._set_studio("caribpr")
         return self._carib(
             url="https://www.caribbeancompr.com",
             source="caribbeancompr.com",
@@ -312,22 +386,16 @@ class StudioScraper(Scraper):
 
     def _1pon(self, url: str = None, source: str = None):
         if not url:
-            self.studio = "1pon"
+            self._set_studio("1pon")
             url = "https://www.1pondo.tv"
             source = "1pondo.tv"
-        try:
-            data = get(
-                f"{url}/dyn/phpauto/movie_details/movie_id/{self.search_id}.json"
-            )
-            data.raise_for_status()
-        except network.HTTPError as e:
-            logger.debug(e)
-            return
-        except network.RequestException as e:
-            logger.warning(e)
+        data = get_response(
+            f"{url}/dyn/phpauto/movie_details/movie_id/{self.search_id}.json"
+        )
+        if data is None:
             return
         try:
-            data = data.json()
+            data = json.loads(data.content)
             return ScrapeResult(
                 product_id=data["MovieID"],
                 title=data["Title"],
@@ -338,31 +406,28 @@ class StudioScraper(Scraper):
             self.error(e)
 
     def _10mu(self):
-        self.studio = "10mu"
+        self._set_studio("10mu")
         return self._1pon(
             url="https://www.10musume.com",
             source="10musume.com",
         )
 
     def _paco(self):
-        self.studio = "paco"
+        self._set_studio("paco")
         return self._1pon(
             url="https://www.pacopacomama.com",
             source="pacopacomama.com",
         )
 
     def _mura(self):
-        self.studio = "mura"
+        self._set_studio("mura")
         return self._1pon(
             url="https://www.muramura.tv",
             source="muramura.tv",
         )
 
     def _mesubuta(self) -> None:
-        self.studio = "mesubuta"
-        self.datefmt = "%y%m%d"
-        if self.match["s3"]:
-            self.search_id = "_".join(self.match.group("s1", "s2", "s3"))
+        self._set_studio("mesubuta")
 
     def _add_suffix(self, product_id: str) -> str:
         result = [product_id, self.studio] if self.studio else [product_id]
@@ -386,15 +451,17 @@ class HeyzoScraper(Scraper):
     source = "heyzo.com"
     regex = r"heyzo[^0-9]*(?P<heyzo>[0-9]{4})"
 
-    def _search(self):
-        uid = self.match["heyzo"]
-        self.search_id = f"HEYZO-{uid}"
+    def _set_id(self):
+        self.search_id = f'HEYZO-{self.match["heyzo"]}'
 
-        tree = get_tree(f"https://www.heyzo.com/moviepages/{uid}/")
-        if tree is None:
+    def _search(self):
+        response = get_response(
+            f'https://www.heyzo.com/moviepages/{self.match["heyzo"]}/'
+        )
+        if response is None:
             return
         try:
-            data = _load_json_ld(tree)
+            data = _load_json_ld(response)
             return ScrapeResult(
                 product_id=self.search_id,
                 title=data["name"],
@@ -406,7 +473,7 @@ class HeyzoScraper(Scraper):
         except (ValueError, KeyError) as e:
             self.warning(e)
 
-        tree = tree.find('.//div[@id="wrapper"]//div[@id="movie"]')
+        tree = parse_tree(response).find('.//div[@id="wrapper"]//div[@id="movie"]')
         try:
             title = tree.findtext("h1").rpartition("\t-")
             date = tree.find(
@@ -428,9 +495,11 @@ class FC2Scraper(Scraper):
     regex = r"fc2(?:[\s-]*ppv)?[\s-]+(?P<fc2>[0-9]{4,10})"
     paywalled = False
 
+    def _set_id(self):
+        self.search_id = f'FC2-{self.match["fc2"]}'
+
     def _search(self):
         uid = self.match["fc2"]
-        self.search_id = f"FC2-{uid}"
         return self._fc2_search(uid) or self._fc2ppvdb(uid)
 
     def _fc2_search(self, uid: str):
@@ -500,10 +569,12 @@ class HeydougaScraper(Scraper):
     source = "heydouga.com"
     regex = r"heydouga[^0-9]*(?P<h1>[0-9]{4})[^0-9]+(?P<heydou>[0-9]{3,6})"
 
+    def _set_id(self):
+        self.search_id = "heydouga-{}-{}".format(*self.match.group("h1", "heydou"))
+
     def _search(self, url: str = None):
         if not url:
             m1, m2 = self.match.group("h1", "heydou")
-            self.search_id = f"heydouga-{m1}-{m2}"
             url = f"https://www.heydouga.com/moviepages/{m1}/{m2}/"
 
         tree = get_tree(url)
@@ -528,11 +599,14 @@ class HeydougaScraper(Scraper):
 class AV9898Scraper(HeydougaScraper):
     regex = r"av9898[^0-9]+(?P<av98>[0-9]{3,})"
 
+    def _set_id(self):
+        self.search_id = f'AV9898-{self.match["av98"]}'
+
     def _search(self):
-        uid = self.match["av98"]
-        self.search_id = f"AV9898-{uid}"
         return super()._search(
-            f"https://av9898.heydouga.com/monthly/av9898/moviepages/{uid}/"
+            "https://av9898.heydouga.com/monthly/av9898/moviepages/{}/".format(
+                self.match["av98"]
+            )
         )
 
 
@@ -553,15 +627,17 @@ class X1XScraper(Scraper):
     source = "x1x.com"
     regex = r"x1x(?:\.com)?[\s-]+(?P<x1x>[0-9]{6})"
 
+    def _set_id(self):
+        self.search_id = f'x1x-{self.match["x1x"]}'
+
     def _search(self):
         uid = self.match["x1x"]
-        self.search_id = f"x1x-{uid}"
-
-        tree = get_tree(f"http://www.x1x.com/title/{uid}")
+        _, tree = probe(
+            f"http://www.x1x.com/title/{uid}",
+            f"http://www.x1x.com/ppv/title/{uid}",
+        )
         if tree is None:
-            tree = get_tree(f"http://www.x1x.com/ppv/title/{uid}")
-            if tree is None:
-                return
+            return
 
         tree = tree.find('.//div[@id="main_content"]')
         try:
@@ -586,26 +662,24 @@ class SMMiracleScraper(Scraper):
     source = "sm-miracle.com"
     regex = r"sm[\s-]*miracle(?:[\s-]+no)?[\s.-]+e?(?P<sm>[0-9]{4})"
 
-    def _search(self):
-        uid = "e" + self.match["sm"]
-        self.search_id = f"sm-miracle-{uid}"
+    def _set_id(self):
+        self.search_id = f'sm-miracle-e{self.match["sm"]}'
 
-        try:
-            data = get(f"https://sm-miracle.com/movie/{uid}.dat")
-            data.raise_for_status()
-        except network.HTTPError as e:
-            logger.debug(e)
+    def _search(self):
+        data = get_response(f'https://sm-miracle.com/movie/e{self.match["sm"]}.dat')
+        if data is None:
             return
-        except network.RequestException as e:
-            logger.warning(e)
+
+        m = re_search(
+            rb'[{,]\s*title\s*:\s*(?P<q>[\'"])(?P<title>.+?)(?P=q)\s*[,}]',
+            data.content,
+        )
+        if not m:
             return
 
         return ScrapeResult(
             product_id=self.search_id,
-            title=re_search(
-                r'[{,]\s*title\s*:\s*(?P<q>[\'"])(?P<title>.+?)(?P=q)\s*[,}]',
-                data.content.decode(errors="ignore"),
-            )["title"],
+            title=m["title"].decode(errors="ignore"),
             source=self.source,
         )
 
@@ -614,19 +688,22 @@ class H4610Scraper(Scraper):
     uncensored = True
     regex = r"(?P<h41>h4610|[ch]0930)\W+(?P<h4610>[a-z]+[0-9]+)"
 
-    def _search(self):
+    def _set_id(self):
         m1, m2 = self.match.group("h41", "h4610")
         self.search_id = f"{m1.upper()}-{m2}"
 
-        tree = get_tree(f"https://www.{m1}.com/moviepages/{m2}/")
-        if tree is None:
+    def _search(self):
+        m1, m2 = self.match.group("h41", "h4610")
+        response = get_response(f"https://www.{m1}.com/moviepages/{m2}/")
+        if response is None:
             return
 
+        tree = parse_tree(response)
         title = tree.findtext(
             './/div[@id="moviePlay"]//div[@class="moviePlay_title"]/h1/span'
         )
         try:
-            date = _load_json_ld(tree)["dateCreated"]
+            date = _load_json_ld(response)["dateCreated"]
         except (TypeError, ValueError, KeyError) as e:
             date = xpath(
                 'string(.//div[@id="movieInfo"]//section'
@@ -650,32 +727,29 @@ class Kin8Scraper(Scraper):
     regex = r"kin8(?:tengoku)?[^0-9]*(?P<kin8>[0-9]{4})"
 
     _re_movie = (
-        r'"movie_id":"(?P<id>\d+)".*?"name_utf8":"(?P<title>[^"]+)"'
-        r'.*?"ecp_start_date":"\$D(?P<date>\d{4}-\d{2}-\d{2})'
+        rb'"movie_id":"(?P<id>\d+)".*?"name_utf8":"(?P<title>[^"]+)"'
+        rb'.*?"ecp_start_date":"\$D(?P<date>\d{4}-\d{2}-\d{2})'
     )
 
-    def _search(self):
-        uid = self.match["kin8"]
-        self.search_id = f"kin8-{uid}"
+    def _set_id(self):
+        self.search_id = f'kin8-{self.match["kin8"]}'
 
-        try:
-            response = get(f"https://www.kin8tengoku.com/movie/{uid}")
-            response.raise_for_status()
-        except network.HTTPError as e:
-            logger.debug(e)
-            return
-        except network.RequestException as e:
-            logger.warning(e)
+    def _search(self):
+        response = get_response(
+            f'https://www.kin8tengoku.com/movie/{self.match["kin8"]}'
+        )
+        if response is None:
             return
 
-        m = re_search(self._re_movie, response.content.decode())
+        # Only the matched fields are decoded, not the whole page.
+        m = re_search(self._re_movie, response.content)
         if not m:
             return
 
         return ScrapeResult(
             product_id=self.search_id,
-            title=m["title"],
-            pub_date=m["date"],
+            title=m["title"].decode(),
+            pub_date=m["date"].decode(),
             source=self.source,
         )
 
@@ -685,10 +759,11 @@ class GirlsDeltaScraper(Scraper):
     source = "girlsdelta.com"
     regex = r"girls[\s-]?delta[^0-9]*(?P<gd>[0-9]{3,4})"
 
+    def _set_id(self):
+        self.search_id = f'GirlsDelta-{self.match["gd"]}'
+
     def _search(self):
         uid = self.match["gd"]
-        self.search_id = f"GirlsDelta-{uid}"
-
         tree = get_tree(f"https://girlsdelta.com/product/{uid}")
         if tree is None or "/product/" not in tree.base_url:
             return
@@ -725,7 +800,7 @@ class UncensoredScraper(Scraper):
         r"([a-z]{1,4}(?:3d2?|2d|2m)+[a-z]{1,4}|r18|t28)[\s-]*([0-9]{2,6})",
     )
 
-    def _search(self):
+    def _set_id(self):
         self.search_id = "-".join(filter(None, self.match.groups()))
 
 
@@ -733,7 +808,7 @@ class OneKGiriScraper(Scraper):
     uncensored = True
     regex = rf"((?:{REG_Y})(?:{REG_M})(?:{REG_D}))[\s-]+([a-z]{{3,8}})(?:-(?P<kg>[a-z]{{3,6}}))?"
 
-    def _search(self):
+    def _set_id(self):
         m = self.match
         i = m.lastindex
         self.search_id = f"{m[i-2]}-{m[i-1]}_{m[i]}"
@@ -753,18 +828,32 @@ class MGSScraper(Scraper):
         logger.info("Load %s MGS entries from '%s'", len(mgs), filename)
         cls.mgs_get = mgs.get
 
-    def _search(self):
-        num, pre, sfx = self.match.group("num", "pre", "sfx")
+    @classmethod
+    def get_nums(cls, pre: str) -> Optional[list]:
+        """Return the known mgstage numbers of a prefix, or None if unknown."""
+        try:
+            return cls.mgs_get(pre)
+        except TypeError:
+            cls._load_mgs()
+            return cls.mgs_get(pre)
+
+    def search(self):
+        # A miss only counts if every source answered, not if a request failed
+        with network.ErrorTracker() as errors:
+            result = super().search()
+        if result is not None or not errors.failed:
+            _get_gazetteer().record(self.match["pre"], result is not None)
+        return result
 
+    def _set_id(self):
+        pre, sfx = self.match.group("pre", "sfx")
         if len(sfx) > 3:
             sfx = sfx.lstrip("0").zfill(3)  # 00079 -> 079
         self.search_id = f"{pre.upper()}-{sfx}"
 
-        try:
-            nums = self.mgs_get(pre)
-        except TypeError:
-            self._load_mgs()
-            nums = self.mgs_get(pre)
+    def _search(self):
+        num, pre = self.match.group("num", "pre")
+        nums = self.get_nums(pre)
 
         if num and self.match["hhb"] is None:
             nums = (num, *(i for i in nums if num != i)) if nums else (num,)
@@ -803,6 +892,91 @@ class MGSScraper(Scraper):
             )
 
 
+class PrefixGazetteer:
+    """
+    Knowledge of the label prefixes of generic IDs. Prefixes in mgs.json and
+    prefixes that resolved before are known. Prefixes that repeatedly failed to
+    resolve, and never succeeded, are marked as failed.
+    """
+
+    KNOWN = 0
+    UNSEEN = 1
+    FAILED = 2
+    max_misses = 3
+
+    def __init__(self, path=None):
+        self.path = data_path("prefixes.json") if path is None else path
+        self.known = set()
+        self.misses = {}
+        self.modified = False
+        self._lock = Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.known.update(data["known"])
+            self.misses.update(data["misses"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Failed to load prefixes from '%s': %s", self.path, e)
+
+    def rank(self, pre: str) -> int:
+        """Rank a prefix as KNOWN, UNSEEN or FAILED."""
+        if pre in self.known or MGSScraper.get_nums(pre) is not None:
+            return self.KNOWN
+        if self.misses.get(pre, 0) >= self.max_misses:
+            return self.FAILED
+        return self.UNSEEN
+
+    def record(self, pre: str, resolved: bool):
+        """Record the outcome of a lookup of a prefix not in mgs.json."""
+        if MGSScraper.get_nums(pre) is not None:
+            return
+        with self._lock:
+            if resolved:
+                if pre in self.known:
+                    return
+                self.known.add(pre)
+                self.misses.pop(pre, None)
+            elif pre in self.known:
+                return
+            else:
+                self.misses[pre] = self.misses.get(pre, 0) + 1
+            if not self.modified:
+                self.modified = True
+                atexit.register(self.save)
+
+    def save(self):
+        """Write the gazetteer to disk, as sorted arrays."""
+        with self._lock:
+            if not self.modified:
+                return
+            data = {
+                "known": sorted(self.known),
+                "misses": dict(sorted(self.misses.items())),
+            }
+            self.modified = False
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Failed to save prefixes to '%s': %s", self.path, e)
+
+
+_gazetteer = None
+_gazetteer_lock = Lock()
+
+
+def _get_gazetteer() -> PrefixGazetteer:
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = PrefixGazetteer()
+    return _gazetteer
+
+
 class DateSearcher:
     source = "date string"
     fmt = {}
@@ -864,13 +1038,25 @@ class DateSearcher:
             logger.error(f"[{cls.__name__}] [{m[0]}] {e}")
 
 
-def _load_json_ld(tree: network.HtmlElement):
-    """Loads JSON-LD from tree.
+_json_ld_finder = re.compile(
+    rb"<script[^>]*?\stype\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>(.*?)</script",
+    flags=re.IGNORECASE | re.DOTALL,
+).search
+
+
+def _load_json_ld(response: network.Response):
+    """Loads JSON-LD from the raw bytes of a response, without decoding the
+    whole page or building an HTML tree.
 
     Raise TypeError if there is no json-ld, ValueError if parsing failed.
     """
+    m = _json_ld_finder(response.content)
+    if m is None:
+        raise TypeError("JSON-LD not found")
     data = re_sub(
-        r"[\t\n\r\f\v]", " ", tree.findtext('.//script[@type="application/ld+json"]')
+        r"[\t\n\r\f\v]",
+        " ",
+        m[1].decode(response.encoding or "utf-8", errors="replace"),
     )
     try:
         return json.loads(data)
@@ -906,10 +1092,15 @@ def _combine_regex(*args: Scraper, b=r"\b") -> re.Pattern:
     return re.compile(result)
 
 
+def _normalize(string: str) -> str:
+    """Lowercase a string and strip common trash for ID matching."""
+    return _sub_trash(" ", _subdash("-", string.lower()))
+
+
 def scrape(string: str) -> Optional[ScrapeResult]:
     """Scrape information from a string."""
 
-    string = _sub_trash(" ", _subdash("-", string.lower()))
+    string = _normalize(string)
 
     m = _maker_matcher(string)
     if m:
@@ -917,15 +1108,97 @@ def scrape(string: str) -> Optional[ScrapeResult]:
         if result:
             return result
     else:
-        for m in _general_matcher(string):
-            result = MGSScraper(m).search()
-            if result:
-                return result
+        result = _search_candidates(_rank_candidates(_general_matcher(string)))
+        if result:
+            return result
     m = _date_matcher(string)
     if m:
         return DateSearcher.search(m)
 
 
+def _rank_candidates(matches) -> tuple:
+    """
+    Order generic ID candidates by their prefixes: known, unseen, then failed.
+    Candidates with failed prefixes are dropped unless in exhaustive mode.
+    """
+    rank = _get_gazetteer().rank
+    ranked = sorted((rank(m["pre"]), i, m) for i, m in enumerate(matches))
+    if not Config.EXHAUSTIVE:
+        ranked = (r for r in ranked if r[0] != PrefixGazetteer.FAILED)
+    return tuple(r[2] for r in ranked)
+
+
+def _search_candidates(matches: tuple) -> Optional[ScrapeResult]:
+    """
+    Search ID candidates concurrently. A result is accepted in the order of
+    the candidates, which is by rank, the rest are cancelled.
+    """
+    if len(matches) <= 1:
+        return MGSScraper(matches[0]).search() if matches else None
+    # Each call gets its own small pool, so the fan-out scales with the
+    # callers instead of queueing on a shared one. It is also separate from
+    # the network pool which the scrapers submit to, so the two can never
+    # wait on each other.
+    pool = ThreadPoolExecutor(
+        min(len(matches), MAX_CANDIDATES), thread_name_prefix="candidate"
+    )
+    try:
+        return first_hit([pool.submit(MGSScraper(m).search) for m in matches])[1]
+    finally:
+        pool.shutdown(wait=False)
+
+
+def extract(string: str) -> Optional[ScrapeResult]:
+    """
+    Extract the product ID, or failing that the date, from a string without
+    network access. Generic IDs are only accepted if their prefix is known.
+    """
+    string = _normalize(string)
+
+    s = _local_scraper(string)
+    if s:
+        return s.extract()
+    m = _date_matcher(string)
+    if m:
+        return DateSearcher.search(m)
+
+
+def _local_scraper(string: str) -> Optional[Scraper]:
+    """Find the scraper for a normalized string, trusting only known IDs."""
+    m = _maker_matcher(string)
+    if m:
+        return _scraper_map[m.lastgroup](m)
+    rank = _get_gazetteer().rank
+    for m in _general_matcher(string):
+        if rank(m["pre"]) == PrefixGazetteer.KNOWN:
+            return MGSScraper(m)
+
+
+def extract_ids(iterable, chunksize: int = 1024, max_workers: int = None):
+    """
+    Extract IDs from an iterable of strings on a process pool, without network
+    access. Yields `(name, scraper, search_id, studio, suffix, date)` tuples
+    in input order, where `scraper` is the name of the scraper class and the
+    product ID is `search_id`, `studio` and `suffix` joined by "-". Fields are
+    None if nothing was found.
+    """
+    return process_map(_extract_row, iterable, chunksize, max_workers)
+
+
+def _extract_row(name: str) -> tuple:
+    string = _normalize(name)
+    s = _local_scraper(string)
+    if s:
+        result = s.extract()
+        studio = getattr(s, "studio", None)
+        head = f"{s.search_id}-{studio}" if studio else s.search_id
+        suffix = result.product_id[len(head) :].lstrip("-") or None
+        return name, type(s).__name__, s.search_id, studio, suffix, result.pub_date
+    m = _date_matcher(string)
+    result = DateSearcher.search(m) if m else None
+    return name, None, None, None, None, result and result.pub_date
+
+
 _scraper_map = {
     "studio": StudioScraper,
     "heyzo": HeyzoScraper,
@@ -0,0 +1,269 @@
+"""
+Persistent state for incremental scans.
+
+Files are identified by device and inode, so a moved file keeps its state. A
+file is unchanged if its size, mtime and name match the recorded ones.
+
+Directory trees are snapshotted for directory timestamp updates: a directory
+whose own mtime is unchanged has the same entries as in the snapshot.
+"""
+
+import logging
+import os
+import sqlite3
+
+from .utils import Status, data_path
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """A SQLite store of the last scrape state of each file."""
+
+    # Statuses that need no work as long as the file is unchanged. Failures
+    # may be transient, e.g. network errors, so they are retried.
+    resolved = (Status.SUCCESS.name,)
+    commit_interval = 1000
+
+    def __init__(self, path=None):
+        self.path = data_path("state.db") if path is None else path
+        self.con = sqlite3.connect(self.path)
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                name TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                product_id TEXT,
+                title TEXT,
+                pub_date REAL,
+                source TEXT,
+                PRIMARY KEY (dev, ino)
+            )"""
+        )
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_unchanged(self, st: os.stat_result, path: str) -> bool:
+        """
+        Return True if the file is unchanged since it was last resolved. The
+        recorded path is updated if the file has been moved.
+        """
+        row = self.con.execute(
+            "SELECT size, mtime, name, path, status FROM files "
+            "WHERE dev = ? AND ino = ?",
+            (st.st_dev, st.st_ino),
+        ).fetchone()
+        if (
+            row is None
+            or row[0] != st.st_size
+            or row[1] != st.st_mtime
+            or row[2] != os.path.basename(path)
+            or row[4] not in self.resolved
+        ):
+            return False
+        if row[3] != path:
+            logger.debug("Moved: '%s' -> '%s'", row[3], path)
+            self._execute(
+                "UPDATE files SET path = ? WHERE dev = ? AND ino = ?",
+                (path, st.st_dev, st.st_ino),
+            )
+        return True
+
+    def lookup(self, dev: int, ino: int, size: int):
+        """
+        Returns `(product_id, title, pub_date, source)` of a file resolved
+        with a scrape result, or None.
+        """
+        return self.con.execute(
+            "SELECT product_id, title, pub_date, source FROM files "
+            "WHERE dev = ? AND ino = ? AND size = ? AND status = ?",
+            (dev, ino, size, Status.SUCCESS.name),
+        ).fetchone()
+
+    def record(
+        self,
+        st: os.stat_result,
+        path: str,
+        status: Status,
+        result=None,
+        mtime: float = None,
+    ):
+        """
+        Record the state of a file. `path` and `mtime` may be the ones expected
+        after pending changes are applied.
+
+        :type result: scraper.ScrapeResult
+        """
+        self._execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                st.st_dev,
+                st.st_ino,
+                st.st_size,
+                st.st_mtime if mtime is None else mtime,
+                os.path.basename(path),
+                path,
+                status.name,
+                result and result.product_id,
+                result and result.title,
+                result and result.pub_date,
+                result and result.source,
+            ),
+        )
+
+    def prune(self, roots, seen=()) -> int:
+        """
+        Delete the rows of files under roots that no longer exist. Rows of the
+        `(dev, ino)` in `seen`, the files found by the scan, are kept, as their
+        path may be the one expected after pending changes. Returns the number
+        of rows deleted.
+        """
+        if not isinstance(roots, (list, tuple)):
+            roots = (roots,)
+        stale = []
+        for root in roots:
+            stale.extend(
+                r
+                for r in self.con.execute(
+                    "SELECT dev, ino, path FROM files WHERE path >= ? AND path < ?",
+                    _subtree_range(root),
+                )
+                if r[:2] not in seen and not os.path.lexists(r[2])
+            )
+        with self.con:
+            self.con.executemany(
+                "DELETE FROM files WHERE dev = ? AND ino = ?", (r[:2] for r in stale)
+            )
+        return len(stale)
+
+    def _execute(self, sql: str, params: tuple):
+        self.con.execute(sql, params)
+        self._pending += 1
+        if self._pending >= self.commit_interval:
+            self.con.commit()
+            self._pending = 0
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+
+class DirSnapshot:
+    """
+    A SQLite snapshot of directory trees: for each directory under a root, its
+    parent, its mtime and the newest mtime of the files directly in it.
+    """
+
+    def __init__(self, path=None):
+        self.path = data_path("dirs.db") if path is None else path
+        # Roots on different devices are updated concurrently
+        self.con = sqlite3.connect(self.path, timeout=60)
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS dirs (
+                root TEXT NOT NULL,
+                path TEXT NOT NULL,
+                parent TEXT,
+                mtime REAL NOT NULL,
+                local REAL NOT NULL,
+                PRIMARY KEY (root, path)
+            )"""
+        )
+        self.con.execute("CREATE INDEX IF NOT EXISTS idx_path ON dirs (path)")
+        self.con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_parent ON dirs (root, parent)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def load(self, root: str, top: str = None) -> dict:
+        """
+        Returns a dict of path -> (mtime, local, children) under root, or only
+        of the subtree at `top`.
+        """
+        sql = "SELECT path, parent, mtime, local FROM dirs WHERE root = ?"
+        params = (root,)
+        if top is not None:
+            sql += " AND (path = ? OR (path >= ? AND path < ?))"
+            params += (top, *_subtree_range(top))
+        rows = self.con.execute(sql, params).fetchall()
+        nodes = {path: (mtime, local, []) for path, _, mtime, local in rows}
+        for path, parent, _, _ in rows:
+            node = nodes.get(parent)
+            if node is not None:
+                node[2].append(path)
+        return nodes
+
+    def lookup(self, path: str):
+        """Returns `(root, mtime)` of a recorded directory, or None."""
+        return self.con.execute(
+            "SELECT root, mtime FROM dirs WHERE path = ?", (path,)
+        ).fetchone()
+
+    def save(self, root: str, rows, top: str = None):
+        """
+        Replace the snapshot of root, or only of the subtree at `top`, by rows
+        of (path, parent, mtime, local).
+        """
+        sql = "DELETE FROM dirs WHERE root = ?"
+        params = (root,)
+        if top is not None:
+            sql += " AND (path = ? OR (path >= ? AND path < ?))"
+            params += (top, *_subtree_range(top))
+        with self.con:
+            self.con.execute(sql, params)
+            self.con.executemany(
+                "INSERT INTO dirs VALUES (?, ?, ?, ?, ?)",
+                ((root, *row) for row in rows),
+            )
+
+    def save_dir(self, root: str, row: tuple, subdirs):
+        """
+        Replace the row (path, parent, mtime, local) of a directory whose
+        entries have been listed. Rows of subdirectories that are gone are
+        deleted, new ones are added with an mtime that never matches, so
+        they are listed on the next run.
+        """
+        path = row[0]
+        subdirs = set(subdirs)
+        with self.con:
+            known = {
+                r[0]
+                for r in self.con.execute(
+                    "SELECT path FROM dirs WHERE root = ? AND parent = ?",
+                    (root, path),
+                )
+            }
+            self.con.executemany(
+                "DELETE FROM dirs WHERE root = ? AND path = ?",
+                ((root, p) for p in known - subdirs),
+            )
+            self.con.executemany(
+                "INSERT INTO dirs VALUES (?, ?, ?, -1, 0)",
+                ((root, p, path) for p in subdirs - known),
+            )
+            self.con.execute(
+                "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)", (root, *row)
+            )
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
+
+
+def _subtree_range(top: str) -> tuple:
+    """Bounds of the paths below top, for an indexed range query."""
+    lower = os.path.join(top, "")
+    return lower, lower[:-1] + chr(ord(os.sep) + 1)
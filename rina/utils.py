@@ -1,12 +1,24 @@
+import json
+import os
+import pickle
 import re
 import sys
+import tempfile
 import time
 from abc import ABC
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from datetime import datetime, timezone
 from enum import Enum
 from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 
 SEP_WIDTH = 50
 SEP_BOLD = "=" * SEP_WIDTH
@@ -20,6 +32,9 @@ class Config:
 
     DRYRUN: bool = False
     YES: bool = False
+    EXHAUSTIVE: bool = False
+    # Writer for machine-readable output, None for text reports
+    JSONL: "JsonlWriter" = None
 
 
 class Status(Enum):
@@ -33,7 +48,7 @@ class Status(Enum):
 class AVInfo(ABC):
     """
     Abstract base class for handling AV information, providing a structure for
-    result storage, presentation, and file operations.
+    result storage, presentation, and records of pending changes.
     """
 
     # Structured result of media processing, for report generation
@@ -51,8 +66,16 @@ class AVInfo(ABC):
         """
         Method to format and print media information.
         """
-        status = self.status
+        if Config.JSONL is None:
+            color_writer(self.report, color=self.status.value)
+        else:
+            Config.JSONL.write({"Status": self.status.name, **self.result})
+
+    @property
+    def report(self) -> str:
+        """The formatted report text."""
         if self._report is None:
+            status = self.status
             # Create a header for the current status
             try:
                 lines = [self._headers[status.name]]
@@ -73,10 +96,85 @@ class AVInfo(ABC):
                     lines.append(f"{k:>{kw}}: {v}\n")
             # Combine into a single text
             self._report = "".join(lines)
-        color_writer(self._report, color=status.value)
+        return self._report
 
-    def apply(self):
-        raise NotImplementedError
+    def to_record(self) -> "Record":
+        """Returns a compact snapshot of the report and pending changes."""
+        return Record(self.status, self.report)
+
+
+class Record(NamedTuple):
+    """
+    A compact, picklable form of a processed AVInfo, keeping only what is needed
+    to print it again and apply its changes with `journal.apply_records`.
+    """
+
+    status: Status
+    report: str
+    path: str = None
+    newpath: str = None
+    newdate: tuple = None  # (atime, mtime), atime None to keep the current
+
+    def print(self):
+        color_writer(self.report, color=self.status.value)
+
+    def to_plan(self) -> dict:
+        return {
+            "op": "file",
+            "path": self.path,
+            "newpath": self.newpath,
+            "newdate": self.newdate,
+        }
+
+
+class Spool:
+    """
+    An append-only sequence of picklable items. Items are kept in memory up to
+    `maxsize`, beyond which they are spilled in batches to an anonymous
+    temporary file, so memory stays bounded however many items are added.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._items = []
+        self._file = None
+        self._batches = 0
+        self._spilled = 0
+
+    def __len__(self):
+        return self._spilled + len(self._items)
+
+    def __iter__(self):
+        f = self._file
+        pos = 0
+        for _ in range(self._batches):
+            f.seek(pos)
+            batch = pickle.load(f)
+            pos = f.tell()
+            yield from batch
+        yield from self._items
+
+    def append(self, item):
+        self._items.append(item)
+        if len(self._items) >= self.maxsize:
+            self._spill()
+
+    def _spill(self):
+        f = self._file
+        if f is None:
+            f = self._file = tempfile.TemporaryFile()
+        f.seek(0, os.SEEK_END)
+        pickle.dump(self._items, f, pickle.HIGHEST_PROTOCOL)
+        self._batches += 1
+        self._spilled += len(self._items)
+        self._items = []
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._items = []
+        self._batches = self._spilled = 0
 
 
 if sys.stdout.isatty():
@@ -90,14 +188,113 @@ else:
         writer(string)
 
 
-def dryrun_method(method):
-    """Decorator for class methods to enable dry run functionality."""
+class JsonlWriter:
+    """
+    Writes objects as JSON lines through a single large buffer. Values that
+    are not JSON serializable, such as paths and exceptions, are written as
+    strings.
+    """
 
-    def wrapper(self, *args, **kwargs):
-        if not Config.DRYRUN:
-            return method(self, *args, **kwargs)
+    def __init__(self, fileobj=None, bufsize: int = 1 << 16):
+        if fileobj is None:
+            fileobj = open(
+                sys.stdout.fileno(),
+                "w",
+                encoding="utf-8",
+                buffering=bufsize,
+                closefd=False,
+            )
+        self._f = fileobj
+        self._encode = json.JSONEncoder(ensure_ascii=False, default=str).encode
 
-    return wrapper
+    def write(self, obj):
+        self._f.write(self._encode(obj) + "\n")
+
+    def flush(self):
+        self._f.flush()
+
+
+def data_path(name: str) -> Path:
+    """
+    Return the path of a file in the user data directory, creating the
+    directory if necessary. The directory can be set with $RINA_HOME.
+    """
+    root = os.environ.get("RINA_HOME")
+    if not root:
+        if os.name == "nt":
+            root = os.path.join(os.environ.get("LOCALAPPDATA", "~"), "rina")
+        else:
+            root = os.path.join(
+                os.environ.get("XDG_DATA_HOME", "~/.local/share"), "rina"
+            )
+    root = Path(root).expanduser()
+    root.mkdir(parents=True, exist_ok=True)
+    return root.joinpath(name)
+
+
+def first_hit(futures: list):
+    """
+    Waits on futures in priority order and returns `(index, result)` of the
+    first one whose result is not None, or `(None, None)` if there is none.
+    Lower-priority futures are cancelled once the outcome is decided.
+    """
+    try:
+        for i, ft in enumerate(futures):
+            result = ft.result()
+            if result is not None:
+                return i, result
+        return None, None
+    finally:
+        for ft in futures:
+            ft.cancel()
+
+
+def process_map(func, iterable, chunksize: int = 1024, max_workers: int = None):
+    """
+    Map `func` over `iterable` on a process pool and yield the results in
+    order. Items are sent in chunks and only a few chunks are in flight at a
+    time, so the input is consumed lazily and memory stays flat. `func` must be
+    a module-level function.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    it = iter(iterable)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers) as ex:
+        while True:
+            while len(pending) < 2 * max_workers:
+                chunk = list(islice(it, chunksize))
+                if not chunk:
+                    break
+                pending.append(ex.submit(_map_chunk, func, chunk))
+            if not pending:
+                break
+            yield from pending.popleft().result()
+
+
+def _map_chunk(func, chunk: list) -> list:
+    return [func(i) for i in chunk]
+
+
+def thread_map(func, iterable, max_workers: int = None, window: int = None):
+    """
+    Map `func` over `iterable` on a thread pool and yield `(item, result)` as
+    tasks complete. At most `window` tasks are in flight, new ones are
+    submitted as others finish, so the input is consumed lazily alongside the
+    work and memory stays flat.
+    """
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+    window = window or 4 * max_workers
+    it = iter(iterable)
+    pending = {}
+    with ThreadPoolExecutor(max_workers) as ex:
+        while True:
+            for item in islice(it, window - len(pending)):
+                pending[ex.submit(func, item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for ft in done:
+                yield pending.pop(ft), ft.result()
 
 
 def get_choice_as_int(msg: str, total: int, default: int = 1) -> int:
@@ -1,11 +1,22 @@
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
 from pathlib import Path
-from typing import Generator
+from typing import Generator, Optional
 
-from .files import DiskScanner, get_scanner
-from .scraper import ScrapeResult, _has_word, scrape
-from .utils import AVInfo, Status, dryrun_method, re_search, re_sub, strftime
+from .files import DiskScanner, get_scanner, scan_roots
+from .scraper import ScrapeResult, _has_word, extract, scrape
+from .state import StateStore
+from .utils import (
+    AVInfo,
+    Record,
+    Status,
+    process_map,
+    re_search,
+    re_sub,
+    stderr_write,
+    strftime,
+    thread_map,
+)
 
 _NAMEMAX = 255
 EXTS = {
@@ -27,6 +38,7 @@ class AVString(AVInfo):
 
     def __init__(self, source: str, result: ScrapeResult, error: Exception = None):
         self.source = source
+        self.scrape_result = result
         if result:
             self.status = Status.SUCCESS
             self.result = {
@@ -94,15 +106,14 @@ class AVFile(AVString):
                 self.result["OldDate"] = strftime(stat.st_mtime)
                 self.status = Status.UPDATED
 
-    @dryrun_method
-    def apply(self):
-        """Rename file and update timestamps based on scrape results."""
-        source = self.source
-        if self.newpath:
-            os.rename(source, self.newpath)
-            source = self.newpath
-        if self.newdate:
-            os.utime(source, self.newdate)
+    def to_record(self) -> Record:
+        return Record(
+            self.status,
+            self.report,
+            os.fspath(self.source),
+            self.newpath and os.fspath(self.newpath),
+            self.newdate,
+        )
 
     @staticmethod
     def _build_filename(product_id: str, title: str, ext: str):
@@ -145,10 +156,10 @@ class AVFile(AVString):
             return f"{product_id} {title}{ext.lower()}"
 
 
-def from_string(string: str):
+def from_string(string: str, offline: bool = False):
     """Analyze a string, returns an AVString object."""
     try:
-        result = scrape(string)
+        result = (extract if offline else scrape)(string)
         error = None
     except Exception as e:
         result = None
@@ -156,30 +167,171 @@ def from_string(string: str):
     return AVString(string, result, error)
 
 
-def from_path(path: str, entry: os.DirEntry = None):
-    """Analyze a path, returns an AVFile object."""
+def from_path(
+    path: str,
+    entry: os.DirEntry = None,
+    offline: bool = False,
+    trust_names: bool = False,
+):
+    """
+    Analyze a path, returns an AVFile object. If `trust_names` is True, files
+    already named in the canonical form are not looked up.
+    """
     path = Path(path)
+    if trust_names:
+        result = _match_organized(path)
+        if result:
+            return AVFile(path, result, None, entry)
+    result, error = _scrape_stem(path.stem, offline)
+    return AVFile(path, result, error, entry)
+
+
+def _match_organized(path: Path) -> Optional[ScrapeResult]:
+    """
+    If the filename is exactly the canonical `{product_id} {title}{ext}` for an
+    ID confidently extracted from it, returns a result built from the name
+    itself. The publish date is only set if the ID carries one.
+    """
     try:
-        result = scrape(path.stem)
-        error = None
+        result = extract(path.stem)
+    except Exception:
+        return
+    if not (result and result.product_id):
+        return
+    prefix = result.product_id + " "
+    if not path.stem.startswith(prefix):
+        return
+    title = path.stem[len(prefix) :]
+    if AVFile._build_filename(result.product_id, title, path.suffix) == path.name:
+        result.title = title
+        return result
+
+
+def _scrape_stem(stem: str, offline: bool = False):
+    """Scrape a filename stem, returns a tuple of (result, error)."""
+    try:
+        return (extract if offline else scrape)(stem), None
     except Exception as e:
-        result = None
-        error = e
-    return AVFile(path, result, error, entry)
+        return None, e
+
 
+def _extract_path(path: str):
+    """Offline worker for the process pool."""
+    return _scrape_stem(Path(path).stem, True)
 
-def from_dir(root, scanner: DiskScanner = None) -> Generator[AVFile, None, None]:
-    """Scan a directory and yield AVFile objects."""
+
+def from_dir(
+    root,
+    scanner: DiskScanner = None,
+    offline: bool = False,
+    incremental: bool = False,
+    trust_names: bool = False,
+    exclude: set = None,
+) -> Generator[AVFile, None, None]:
+    """
+    Scan a directory, or a list of directories, and yield AVFile objects.
+
+    Parameters:
+     - offline: Extract IDs and dates from filenames on a process pool without
+       network access.
+     - incremental: Skip files that are unchanged since they were last
+       resolved, according to the persistent state store.
+     - trust_names: Skip the lookup for files already named in the canonical
+       form.
+     - exclude: Paths to skip, e.g. files already processed by a resumed run.
+    """
     if scanner is None:
         scanner = DiskScanner(exts=EXTS)
+    entries = scan_roots(root, scanner.scandir)
+    if exclude:
+        entries = (e for e in entries if e.path not in exclude)
+    if offline:
+        return _extract_entries(entries)
+    if incremental:
+        return _scrape_incremental(entries, root, trust_names)
+    return _scrape_entries(entries, trust_names=trust_names)
+
+
+def _scrape_entries(entries, store: StateStore = None, trust_names: bool = False):
+    def analyze(e: os.DirEntry):
+        return from_path(e.path, e, trust_names=trust_names)
+
+    # Entries are pulled from the scanner as results complete
+    for e, obj in thread_map(analyze, entries):
+        if store is not None:
+            _record_state(store, e, obj)
+        yield obj
+
+
+def _scrape_incremental(entries, roots, trust_names: bool = False):
+    skipped = 0
+    seen = set()  # (dev, ino) of the files found
+    with StateStore() as store:
+
+        def changed():
+            nonlocal skipped
+            for e in entries:
+                try:
+                    st = e.stat()
+                    seen.add((st.st_dev, st.st_ino))
+                    if store.is_unchanged(st, e.path):
+                        skipped += 1
+                        continue
+                except OSError:
+                    pass
+                yield e
+
+        yield from _scrape_entries(changed(), store, trust_names)
+        # The scan is complete, forget the files that are gone
+        pruned = store.prune(roots, seen)
+    stderr_write(f"Skipped {skipped} unchanged files. Pruned {pruned} states.\n")
+
+
+def _record_state(store: StateStore, entry: os.DirEntry, obj: AVFile):
+    """
+    Record the state of a scraped file. For a file with pending changes, the
+    state expected after they are applied is recorded, so it is skipped next
+    time only if the changes were actually made.
+    """
+    if obj.status == Status.ERROR:
+        return
+    try:
+        st = entry.stat()
+    except OSError:
+        return
+    if obj.status == Status.UPDATED:
+        store.record(
+            st,
+            os.fspath(obj.newpath or obj.source),
+            Status.SUCCESS,
+            obj.scrape_result,
+            obj.newdate and obj.newdate[1],
+        )
+    else:
+        store.record(st, entry.path, obj.status, obj.scrape_result)
+
+
+def _extract_entries(entries):
+    # Results come back in input order, pair them with the queued entries
+    queue = deque()
+
+    def paths():
+        for e in entries:
+            queue.append(e)
+            yield e.path
 
-    with ThreadPoolExecutor() as ex:
-        for ft in as_completed(
-            ex.submit(from_path, e.path, e) for e in scanner.scandir(root)
-        ):
-            yield ft.result()
+    for result, error in process_map(_extract_path, paths(), 256):
+        e = queue.popleft()
+        yield AVFile(e.path, result, error, e)
 
 
-def from_args(args):
+def from_args(args, exclude: set = None):
     """:type args: argparse.Namespace"""
-    return from_dir(args.source, get_scanner(args, exts=EXTS))
+    return from_dir(
+        args.source,
+        get_scanner(args, exts=EXTS),
+        offline=args.offline,
+        incremental=args.incremental,
+        trust_names=args.trust_names,
+        exclude=exclude,
+    )
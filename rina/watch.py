@@ -0,0 +1,308 @@
+"""
+Continuous ingestion of new videos using Linux inotify.
+
+Directories are watched recursively for files being written or moved in. A
+file is processed once it has been quiet for a settling period with a stable
+size, so partially downloaded files are left alone. New arrivals are scraped
+and their changes applied right away, then the timestamps of their parent
+directories are updated without rescanning the tree. If the kernel's event
+queue overflows, the trees are rescanned for files changed since the watch
+began.
+"""
+
+import ctypes
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from . import video
+from .files import DiskScanner, _EADIR, update_parents
+from .journal import Journal, apply_records
+from .utils import Config, Status, stderr_write
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE_SELF
+    | IN_ONLYDIR
+    | IN_EXCL_UNLINK
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Inotify:
+    """A minimal ctypes binding of the Linux inotify API."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("Watch mode requires Linux inotify.")
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    @staticmethod
+    def _raise(path=None):
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), path)
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise(path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read(self, timeout: float = None):
+        """
+        Wait up to `timeout` seconds for events, yielding `(wd, mask, cookie,
+        name)` tuples.
+        """
+        if not select.select((self.fd,), (), (), timeout)[0]:
+            return
+        data = os.read(self.fd, 1 << 16)
+        offset = 0
+        size = _EVENT.size
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            yield wd, mask, cookie, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    Watches directory trees and processes new video files as they settle.
+
+    Parameters:
+     - scanner: Filters for files and directories, built once for the run.
+     - settle: Seconds a file must stay unchanged before it is processed.
+     - offline, trust_names: See `video.from_path`.
+    """
+
+    def __init__(
+        self,
+        scanner: DiskScanner,
+        settle: float = 5.0,
+        offline: bool = False,
+        trust_names: bool = False,
+    ):
+        self.scanner = scanner
+        self.settle = settle
+        self.offline = offline
+        self.trust_names = trust_names
+        self.inotify = Inotify()
+        self.wds = {}  # wd -> directory path
+        self.roots = {}  # directory path -> its root
+        self.top = []  # the roots, as given
+        self.started = time.time()
+        self.processed = set()  # paths of files processed
+        self.pending = {}  # file path -> (deadline, size)
+        self.produced = set()  # paths we renamed files to
+        self.journal = None
+        self.total = self.changed = 0
+
+    def add_root(self, root):
+        root = os.fspath(root)
+        self.top.append(root)
+        self._watch_tree(root, root, scan=False)
+
+    def _watch_tree(self, path: str, root: str, scan: bool, since: float = None):
+        """
+        Watch a directory and, if the scanner is recursive, its subdirectories.
+        If `scan` is True, also schedule the files already in them, or only
+        those not yet processed whose ctime is at least `since`.
+        """
+        self._add_watch(path, root)
+        recursive = self.scanner.recursive
+        for dirs, files in self.scanner.walk(path):
+            if recursive:
+                for e in dirs:
+                    self._add_watch(e.path, root)
+            if scan:
+                for e in files:
+                    if since is None or self._is_new(e, since):
+                        self._schedule(e.path)
+
+    def _is_new(self, e: os.DirEntry, since: float) -> bool:
+        # A rename updates the ctime, so files moved in are new as well
+        if e.path in self.processed or e.path in self.pending:
+            return False
+        try:
+            return e.stat().st_ctime >= since
+        except OSError:
+            return False
+
+    def _rescan(self):
+        """
+        Recover from lost events: watch the directories created in the
+        meantime and schedule the files that arrived since the watch began.
+        """
+        logger.warning("Inotify queue overflowed, rescanning the watched trees.")
+        # File timestamps lag the clock a little, allow a second of slack
+        since = self.started - 1
+        for root in self.top:
+            if os.path.isdir(root):
+                self._watch_tree(root, root, scan=True, since=since)
+
+    def _add_watch(self, path: str, root: str):
+        if path in self.roots:
+            return
+        try:
+            wd = self.inotify.add_watch(path, WATCH_MASK)
+        except OSError as e:
+            logger.error(e)
+            return
+        self.wds[wd] = path
+        self.roots[path] = root
+
+    def _unwatch_tree(self, path: str):
+        prefix = os.path.join(path, "")
+        for wd, d in tuple(self.wds.items()):
+            if d == path or d.startswith(prefix):
+                self.inotify.rm_watch(wd)
+                del self.wds[wd]
+                del self.roots[d]
+
+    def _schedule(self, path: str):
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            return
+        self.pending[path] = (time.monotonic() + self.settle, size)
+
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            self._rescan()
+            return
+        parent = self.wds.get(wd)
+        if parent is None:
+            return
+        if mask & (IN_IGNORED | IN_DELETE_SELF):
+            if mask & IN_IGNORED:
+                del self.wds[wd]
+                self.roots.pop(parent, None)
+            return
+        path = os.path.join(parent, name)
+        if mask & IN_ISDIR:
+            if mask & IN_MOVED_FROM:
+                self._unwatch_tree(path)
+            elif name != _EADIR and self.scanner.recursive:
+                dirmatch = self.scanner.dirmatch
+                if dirmatch is None or dirmatch(name):
+                    self._watch_tree(path, self.roots[parent], scan=True)
+        elif mask & IN_MOVED_FROM:
+            self.pending.pop(path, None)
+        elif path in self.produced:
+            self.produced.discard(path)
+        else:
+            match = self.scanner.match
+            if match is None or match(Path(path)):
+                self._schedule(path)
+
+    def _process_due(self) -> float:
+        """
+        Process files that have settled, returns the seconds until the next
+        one is due, or None if nothing is pending.
+        """
+        now = time.monotonic()
+        due = [p for p, v in self.pending.items() if v[0] <= now]
+        for path in due:
+            size = self.pending.pop(path)[1]
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if st.st_size != size:
+                # Still being written
+                self.pending[path] = (now + self.settle, st.st_size)
+                continue
+            self._process(path)
+            if Config.JSONL is not None:
+                Config.JSONL.flush()
+        if self.pending:
+            return max(min(v[0] for v in self.pending.values()) - now, 0)
+
+    def _process(self, path: str):
+        obj = video.from_path(
+            path, offline=self.offline, trust_names=self.trust_names
+        )
+        obj.print()
+        self.total += 1
+        if obj.status == Status.ERROR:
+            return
+        self.processed.add(path)
+        if obj.status == Status.UPDATED:
+            self.changed += 1
+            if obj.newpath:
+                self.produced.add(os.fspath(obj.newpath))
+                self.processed.add(os.fspath(obj.newpath))
+            for _, e in apply_records((obj.to_record(),), self.journal):
+                if e is not None:
+                    stderr_write(f"Failed to process file: {e}\n")
+        root = self.roots.get(os.path.dirname(path))
+        if root is not None:
+            update_parents(obj.newpath or path, root)
+
+    def run(self):
+        """Watch until interrupted."""
+        stderr_write(
+            f"Watching {len(self.wds)} directories. Press Ctrl+C to stop.\n"
+        )
+        with nullcontext() if Config.DRYRUN else Journal() as journal:
+            self.journal = journal
+            timeout = None
+            try:
+                while self.wds:
+                    for wd, mask, _, name in self.inotify.read(timeout):
+                        self._handle(wd, mask, name)
+                    timeout = self._process_due()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self.inotify.close()
+        stderr_write(
+            f"Watch stopped. Processed: {self.total}. Changed: {self.changed}.\n"
+        )
+
+
+def watch(roots, scanner: DiskScanner, **kwargs):
+    """Watch directories and process new videos. See `Watcher`."""
+    if not isinstance(roots, (list, tuple)):
+        roots = (roots,)
+    watcher = Watcher(scanner, **kwargs)
+    for root in roots:
+        watcher.add_root(root)
+    watcher.run()
@@ -1,7 +1,31 @@
+import io
+import json
+import os
 import re
+import sys
+import tempfile
+import threading
+import time
 import unittest
-
-from rina import birth, concat, files, idol, scraper, utils, video
+from concurrent.futures import Future
+from pathlib import Path
+
+from rina import (
+    birth,
+    catalog,
+    concat,
+    dupes,
+    files,
+    idol,
+    journal,
+    network,
+    plan,
+    runfile,
+    scraper,
+    state,
+    utils,
+    video,
+)
 from rina.network import get_tree
 
 
@@ -237,6 +261,117 @@ class Test_Scraper(unittest.TestCase):
                 self.assertEqual(v, result.pub_date)
                 self.assertEqual(source, result.source)
 
+    def test_extract(self):
+        values = {
+            "[CARIB] 082920_001   (high) 3 haha 5": (
+                "082920-001-carib-high-3",
+                1598659200,
+            ),
+            "010617-460 1pon [1080p]": ("010617_460-1pon-1080p", 1483660800),
+            "heyzo-0755-c": ("HEYZO-0755-C", None),
+            "FC2-PPV-1021420_3": ("FC2-1021420-3", None),
+            "zzzq-123 siro-1204": ("SIRO-1204", None),
+            "welivetogether.15.08.20.daisy.summers": (None, 1440028800),
+            "Ray Milf  28Jul2015 1080p": (None, 1438041600),
+            "zzzq-123": None,
+        }
+        for k, v in values.items():
+            result = scraper.extract(k)
+            if v is None:
+                self.assertIsNone(result)
+            else:
+                self.assertEqual(v, (result.product_id, result.pub_date), msg=k)
+
+    def test_extract_ids(self):
+        names = ["heyzo-0755-c", "junk", "[CARIB] 082920_001 (high)"] * 3
+        answer = [
+            ("heyzo-0755-c", "HeyzoScraper", "HEYZO-0755", None, "C", None),
+            ("junk", None, None, None, None, None),
+            (
+                "[CARIB] 082920_001 (high)",
+                "StudioScraper",
+                "082920-001",
+                "carib",
+                "high",
+                1598659200,
+            ),
+        ] * 3
+        result = list(scraper.extract_ids(iter(names), chunksize=2, max_workers=2))
+        self.assertEqual(result, answer)
+
+    def test_search_candidates(self):
+        string = "aaa-101 bbb-102 ccc-103 ddd-104 eee-105"
+        matches = tuple(scraper._general_matcher(string))
+        called = []
+        hit = threading.Event()
+        release = threading.Event()
+
+        def search(self):
+            pre = self.match["pre"]
+            called.append(pre)
+            if pre == "aaa":
+                return None
+            if pre == "bbb":
+                hit.wait(5)
+                return pre
+            hit.set()
+            release.wait(5)
+            return pre
+
+        search_orig = scraper.MGSScraper.search
+        max_orig = scraper.MAX_CANDIDATES
+        scraper.MGSScraper.search = search
+        try:
+            # "ccc" finishes first, but "bbb" wins once "aaa" misses.
+            release.set()
+            self.assertEqual(scraper._search_candidates(matches[:3]), "bbb")
+            # With both slots busy, the queued candidates never start.
+            called.clear()
+            hit.clear()
+            release.clear()
+            scraper.MAX_CANDIDATES = 2
+            self.assertEqual(scraper._search_candidates(matches[1:]), "bbb")
+            release.set()
+            for t in threading.enumerate():
+                if t.name.startswith("candidate"):
+                    t.join()
+            self.assertIn("ccc", called)
+            self.assertNotIn("eee", called)
+        finally:
+            scraper.MGSScraper.search = search_orig
+            scraper.MAX_CANDIDATES = max_orig
+
+    def test_prefix_gazetteer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prefixes.json")
+            g = scraper.PrefixGazetteer(path)
+            for _ in range(g.max_misses):
+                g.record("zzzq", False)
+            g.record("zzzr", True)
+            g.record("zzzs", False)
+            g.save()
+
+            g = scraper.PrefixGazetteer(path)
+            self.assertEqual(g.rank("siro"), g.KNOWN)
+            self.assertEqual(g.rank("zzzr"), g.KNOWN)
+            self.assertEqual(g.rank("zzzs"), g.UNSEEN)
+            self.assertEqual(g.rank("zzzq"), g.FAILED)
+            g.record("zzzq", True)
+            self.assertEqual(g.rank("zzzq"), g.KNOWN)
+            g.save()
+
+    def test_load_json_ld(self):
+        page = (
+            '<html><head><script type="application/ld+json">\n'
+            '{"name": "美人\t姉妹", "dateCreated": "2015-09-09"}</script>'
+            "</head><body></body></html>"
+        ).encode("utf-8")
+        data = scraper._load_json_ld(Duck(content=page, encoding="utf-8"))
+        self.assertEqual(data["name"], "美人 姉妹")
+        self.assertEqual(data["dateCreated"], "2015-09-09")
+        with self.assertRaises(TypeError):
+            scraper._load_json_ld(Duck(content=b"<html></html>", encoding=None))
+
 
 class Test_Idol(unittest.TestCase):
 
@@ -344,6 +479,21 @@ class Test_AVFile(unittest.TestCase):
                 self.assertLessEqual(len(result.encode("utf-8")), video._NAMEMAX)
                 self.assertRegex(result, r"\w")
 
+    def test_match_organized(self):
+        result = video._match_organized(video.Path("SIRO-1234 美人 姉妹.mp4"))
+        self.assertEqual(result.product_id, "SIRO-1234")
+        self.assertEqual(result.title, "美人 姉妹")
+        result = video._match_organized(video.Path("SIRO-1234-C 美人.mp4"))
+        self.assertEqual(result.product_id, "SIRO-1234-C")
+        for name in (
+            "SIRO-1234 美人  姉妹.mp4",
+            "SIRO-1234 美人.MP4",
+            "siro-1234 美人.mp4",
+            "SIRO-1234.mp4",
+            "[SIRO-1234] 美人.mp4",
+        ):
+            self.assertIsNone(video._match_organized(video.Path(name)), name)
+
 
 class Test_Birth_List(unittest.TestCase):
     url = "http://www.minnano-av.com/actress_list.php?birthday=1989"
@@ -409,6 +559,367 @@ class Test_Utils(unittest.TestCase):
                         f"'{pattern}' matched '{strings[i]}' (should only match from {x} to {y}).",
                     )
 
+    def test_first_hit(self):
+        def futures(*results):
+            fts = [Future() for _ in results]
+            for ft, r in zip(fts, results):
+                if r != "pending":
+                    ft.set_result(r)
+            return fts
+
+        self.assertEqual(utils.first_hit(futures(None, "b", "c")), (1, "b"))
+        self.assertEqual(utils.first_hit(futures(None, None)), (None, None))
+        fts = futures("a", "pending")
+        self.assertEqual(utils.first_hit(fts), (0, "a"))
+        self.assertTrue(fts[1].cancelled())
+
+    def test_spool(self):
+        records = [
+            utils.Record(utils.Status.UPDATED, f"report {i}\n", f"{i}.mp4")
+            for i in range(10)
+        ]
+        spool = utils.Spool(maxsize=3)
+        for r in records:
+            spool.append(r)
+        self.assertEqual(len(spool), 10)
+        self.assertEqual(list(spool), records)
+        self.assertEqual(list(spool), records)
+        spool.close()
+        self.assertEqual(list(spool), [])
+
+    def test_jsonl_output(self):
+        f = io.StringIO()
+        utils.Config.JSONL = utils.JsonlWriter(f)
+        try:
+            video.AVString("ABC-123", None).print()
+            video.AVString("ABC-124", None, OSError("失敗")).print()
+        finally:
+            utils.Config.JSONL = None
+        lines = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual(lines[0]["Status"], "FAILURE")
+        self.assertEqual(lines[0]["Target"], "ABC-123")
+        self.assertEqual(
+            lines[1], {"Status": "ERROR", "Target": "ABC-124", "Error": "失敗"}
+        )
+
+    def test_thread_map(self):
+        consumed = 0
+        inflight = []
+
+        def items():
+            nonlocal consumed
+            for i in range(100):
+                consumed += 1
+                yield i
+
+        results = {}
+        for i, r in utils.thread_map(lambda x: x * 2, items(), 2, 5):
+            inflight.append(consumed - len(results))
+            results[i] = r
+        self.assertEqual(results, {i: i * 2 for i in range(100)})
+        self.assertLessEqual(max(inflight), 5)
+
+
+class Test_Network(unittest.TestCase):
+
+    def test_mirror_acquire(self):
+        group = network._MirrorGroup(("a.test", "b.test"))
+        group.latency.update({"a.test": 0.5, "b.test": 0.1})
+        held = []
+        for _ in range(network.DEFAULT_SETTING["max_connection"]):
+            netloc, semaphore = group._acquire(set())
+            self.assertEqual(netloc, "b.test")
+            held.append(semaphore)
+        # the fastest mirror is busy, spill over to the other one
+        netloc, semaphore = group._acquire(set())
+        self.assertEqual(netloc, "a.test")
+        held.append(semaphore)
+        for semaphore in held:
+            semaphore.release()
+
+        group.down["b.test"] = time.monotonic()
+        netloc, semaphore = group._acquire(set())
+        semaphore.release()
+        self.assertEqual(netloc, "a.test")
+
+    def test_init_mirrors(self):
+        network.SITE_SETTINGS["a.test"] = {"mirrors": ("b.test",)}
+        try:
+            network._init_mirrors()
+            group = network._mirrors["a.test"]
+            self.assertIs(network._mirrors["b.test"], group)
+            self.assertEqual(group.netlocs, ("a.test", "b.test"))
+            settings = network.SITE_SETTINGS
+            self.assertIs(settings["b.test"], settings["a.test"])
+        finally:
+            for netloc in ("a.test", "b.test"):
+                network.SITE_SETTINGS.pop(netloc, None)
+                network._mirrors.pop(netloc, None)
+
+    def test_error_tracker(self):
+        with network.ErrorTracker() as errors:
+            network.submit(lambda: None).result()
+        self.assertFalse(errors.failed)
+        with network.ErrorTracker() as outer:
+            with network.ErrorTracker() as errors:
+                network.submit(network.note_error).result()
+        self.assertTrue(errors.failed)
+        self.assertTrue(outer.failed)
+        # errors outside of a tracker are not recorded
+        network.note_error()
+        self.assertFalse(network.ErrorTracker().failed)
+
+
+class Test_State(unittest.TestCase):
+
+    def test_state_store(self):
+        def st(ino, size=100, mtime=1.0):
+            return Duck(st_dev=1, st_ino=ino, st_size=size, st_mtime=mtime)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.db")
+            with state.StateStore(path) as store:
+                store.record(st(1), "/a/x.mp4", utils.Status.SUCCESS)
+                store.record(st(2), "/a/y.mp4", utils.Status.UPDATED)
+                store.record(st(3), "/a/z.mp4", utils.Status.SUCCESS, mtime=5.0)
+                store.record(st(5), "/a/u.mp4", utils.Status.FAILURE)
+
+            with state.StateStore(path) as store:
+                self.assertTrue(store.is_unchanged(st(1), "/a/x.mp4"))
+                self.assertTrue(store.is_unchanged(st(1), "/b/x.mp4"))
+                self.assertFalse(store.is_unchanged(st(1), "/b/w.mp4"))
+                self.assertFalse(store.is_unchanged(st(1, size=1), "/b/x.mp4"))
+                self.assertFalse(store.is_unchanged(st(2), "/a/y.mp4"))
+                self.assertFalse(store.is_unchanged(st(3), "/a/z.mp4"))
+                self.assertTrue(store.is_unchanged(st(3, mtime=5.0), "/a/z.mp4"))
+                self.assertFalse(store.is_unchanged(st(4), "/a/v.mp4"))
+                self.assertFalse(store.is_unchanged(st(5), "/a/u.mp4"))
+
+                kept = os.path.join(tmp, "kept.mp4")
+                Path(kept).touch()
+                store.record(st(6), kept, utils.Status.SUCCESS)
+                store.record(st(7), os.path.join(tmp, "gone.mp4"), utils.Status.SUCCESS)
+                # A file found by the scan, recorded under its pending new name
+                store.record(st(8), os.path.join(tmp, "new.mp4"), utils.Status.SUCCESS)
+                self.assertEqual(store.prune(tmp, {(1, 8)}), 1)
+                self.assertTrue(store.is_unchanged(st(8), os.path.join(tmp, "new.mp4")))
+                self.assertTrue(store.is_unchanged(st(6), kept))
+                self.assertTrue(store.is_unchanged(st(1), "/b/x.mp4"))
+
+    def test_dir_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, "root")
+            for d in ("a/b", "c"):
+                os.makedirs(os.path.join(root, d))
+            for name, mtime in (("a/b/1.mp4", 1000), ("a/2.mp4", 2000), ("c/3", 500)):
+                path = os.path.join(root, name)
+                open(path, "w").close()
+                os.utime(path, (mtime, mtime))
+
+            def mtimes():
+                return {d: os.stat(os.path.join(root, d)).st_mtime for d in dirs}
+
+            dirs = ("", "a", "a/b", "c")
+            with state.DirSnapshot(os.path.join(tmp, "dirs.db")) as snapshot:
+
+                def update(full=False):
+                    return files._update_tree(root, snapshot, full, 4)
+
+                self.assertEqual(update(), (4, 4))
+                self.assertEqual(mtimes(), dict(zip(dirs, (2000, 2000, 1000, 500))))
+                self.assertEqual(update(), (4, 0))
+
+                # A new file changes its directory
+                path = os.path.join(root, "c", "4")
+                open(path, "w").close()
+                os.utime(path, (4000, 4000))
+                self.assertEqual(update(), (4, 2))
+                self.assertEqual(mtimes()[""], 4000)
+
+                # A file modified in place is only seen by a full update
+                os.utime(os.path.join(root, "a/b/1.mp4"), (3000, 3000))
+                self.assertEqual(update(), (4, 0))
+                self.assertEqual(update(full=True), (4, 2))
+                self.assertEqual(mtimes()["a"], 3000)
+
+
+class Test_Catalog(unittest.TestCase):
+
+    def test_refresh_and_query(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, "lib")
+            os.makedirs(os.path.join(root, "idol"))
+            names = ("idol/heyzo-0755.mp4", "idol/FC2-1021420.mp4", "junk.mp4", "a.txt")
+            paths = [os.path.join(root, n) for n in names]
+            for p in paths:
+                open(p, "w").close()
+            scanner = files.DiskScanner(exts=video.EXTS)
+            with state.StateStore(os.path.join(tmp, "state.db")) as store:
+                st = os.stat(paths[1])
+                result = Duck(
+                    product_id="FC2-1021420", title="Title", pub_date=1.5e9, source="s"
+                )
+                store.record(st, paths[1], utils.Status.SUCCESS, result)
+                with catalog.Catalog(os.path.join(tmp, "catalog.db")) as c:
+                    self.assertEqual(c.refresh([root], scanner, store), (3, 3, 0))
+                    self.assertEqual(c.refresh([root], scanner, store), (3, 0, 0))
+                    self.assertEqual(
+                        list(c.query(no_id=True)), [(paths[2], None, None, None)]
+                    )
+                    self.assertEqual(
+                        list(c.query(product_id="fc2-*", after=1.4e9)),
+                        [(paths[1], "FC2-1021420", 1.5e9, "Title")],
+                    )
+                    self.assertEqual(
+                        [r[0] for r in c.query([root + "/idol"])], sorted(paths[:2])
+                    )
+                    self.assertEqual([r[0] for r in c.query([root + "/id"])], [])
+
+                    os.remove(paths[0])
+                    self.assertEqual(c.refresh([root], scanner, store), (2, 0, 1))
+
+
+class Test_Journal(unittest.TestCase):
+
+    def test_apply_and_rollback(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            names = ("a.mp4", "b.mp4", "c.mp4")
+            paths = [os.path.join(tmp, n) for n in names]
+            for p in paths:
+                open(p, "w").close()
+                os.utime(p, (1000, 1000))
+            records = [
+                utils.Record(utils.Status.UPDATED, "", paths[0], paths[0] + ".new"),
+                utils.Record(utils.Status.UPDATED, "", paths[1], None, (5, 5000)),
+                utils.Record(utils.Status.UPDATED, "", paths[2], paths[2] + ".new"),
+            ]
+            jpath = os.path.join(tmp, "journal.jsonl")
+            with journal.Journal(jpath) as j:
+                results = dict(journal.apply_records(records[:2], j))
+            self.assertEqual(list(results.values()), [None, None])
+            self.assertTrue(os.path.exists(paths[0] + ".new"))
+            self.assertEqual(os.stat(paths[1]).st_mtime, 5000)
+
+            # Resume: done operations are skipped
+            with journal.Journal(jpath, resume=True) as j:
+                results = dict(journal.apply_records(records, j))
+            self.assertEqual(list(results.values()), [None, None, None])
+            self.assertFalse(os.path.exists(paths[2]))
+
+            self.assertEqual(journal.rollback(jpath), [])
+            self.assertCountEqual(os.listdir(tmp), (*names, "journal.rolledback"))
+            for p in paths:
+                self.assertEqual(os.stat(p).st_mtime, 1000)
+
+    def test_keep_atime(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.mp4")
+            open(path, "w").close()
+            os.utime(path, (1000, 2000))
+            record = utils.Record(utils.Status.UPDATED, "", path, None, (None, 5000))
+            jpath = os.path.join(tmp, "journal.jsonl")
+            with journal.Journal(jpath) as j:
+                dict(journal.apply_records([record], j))
+            st = os.stat(path)
+            self.assertEqual((st.st_atime, st.st_mtime), (1000, 5000))
+            self.assertEqual(journal.rollback(jpath), [])
+            self.assertEqual(os.stat(path).st_mtime, 2000)
+
+
+class Test_Plan(unittest.TestCase):
+
+    def test_plan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f"{i}.mp4") for i in range(3)]
+            for p in paths:
+                open(p, "w").close()
+                os.utime(p, (1000, 1000))
+            records = [
+                utils.Record(utils.Status.UPDATED, "", p, p + ".new", (5, 5000))
+                for p in paths
+            ]
+            plan_path = os.path.join(tmp, "plan.jsonl")
+            self.assertEqual(plan.save_plan(plan_path, records, "video"), 3)
+            os.utime(paths[2], (2000, 2000))
+            plan.apply_plan(plan_path)
+            for p in paths[:2]:
+                self.assertFalse(os.path.exists(p))
+                self.assertEqual(os.stat(p + ".new").st_mtime, 5000)
+            self.assertEqual(os.stat(paths[2]).st_mtime, 2000)
+            # Applying again resumes from the journal
+            plan.apply_plan(plan_path)
+            self.assertEqual(os.stat(paths[0] + ".new").st_mtime, 5000)
+
+
+class Test_RunFile(unittest.TestCase):
+
+    def test_run_file(self):
+        def obj(path, status, newdate=None):
+            r = utils.Record(status, f"{path}\n", path, None, newdate)
+            return Duck(status=status, to_record=lambda: r)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.jsonl")
+            run = runfile.RunFile(path)
+            objs = [
+                obj("a.mp4", utils.Status.UPDATED, (1.0, 2.0)),
+                obj("b.mp4", utils.Status.ERROR),
+                obj("c.mp4", utils.Status.FAILURE),
+            ]
+            self.assertEqual(list(run.track(objs)), objs)
+            run.close()
+            with open(path, "a", encoding="utf-8") as f:
+                f.write('{"status": "SUCC')
+
+            run = runfile.RunFile(path)
+            self.assertSetEqual(run.done, {"a.mp4", "c.mp4"})
+            records = list(run.records())
+            self.assertEqual(records[0], objs[0].to_record())
+            self.assertEqual(records[1], objs[2].to_record())
+            list(run.track([obj("d.mp4", utils.Status.SUCCESS)]))
+            run.close()
+            run = runfile.RunFile(path)
+            self.assertSetEqual(run.done, {"a.mp4", "c.mp4", "d.mp4"})
+            run.close(remove=True)
+            self.assertFalse(os.path.exists(path))
+
+    def test_prune(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            old, new = (os.path.join(tmp, f"{n}.jsonl") for n in ("old", "new"))
+            for p in old, new:
+                open(p, "w").close()
+            t = time.time() - runfile.MAX_AGE - 1
+            os.utime(old, (t, t))
+            self.assertEqual(runfile.prune(tmp), 1)
+            self.assertEqual(os.listdir(tmp), ["new.jsonl"])
+
+
+class Test_Dupes(unittest.TestCase):
+
+    def test_fingerprint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            size = 100000
+            data = bytearray(os.urandom(size))
+            paths = [os.path.join(tmp, f"{i}.mp4") for i in range(4)]
+            for p in paths[:2]:
+                with open(p, "wb") as f:
+                    f.write(data)
+            # Differs outside of the sampled blocks
+            data[size // 4] ^= 0xFF
+            with open(paths[2], "wb") as f:
+                f.write(data)
+            # Differs in the last block
+            data[-1] ^= 0xFF
+            with open(paths[3], "wb") as f:
+                f.write(data)
+            fps = [dupes.fingerprint(p, size, 3, 1024) for p in paths]
+            self.assertEqual(fps[0], fps[1])
+            self.assertEqual(fps[0], fps[2])
+            self.assertNotEqual(fps[0], fps[3])
+            self.assertNotEqual(
+                dupes.fingerprint(paths[0], size), dupes.fingerprint(paths[3], size)
+            )
+
 
 class Test_DiskScanner(unittest.TestCase):
 
@@ -421,9 +932,7 @@ class Test_DiskScanner(unittest.TestCase):
         for kwargs, entries, answer in values:
             scanner = files.DiskScanner(**kwargs)
             entries = [DuckOSEntry(name=name) for name in entries]
-            for f in scanner.filters:
-                entries[:] = f(entries)
-            result = {e.name for e in entries}
+            result = {e.name for e in entries if scanner.match(e)}
             self.assertSetEqual(result, answer)
 
     def test_mix_filter(self):
@@ -438,10 +947,140 @@ class Test_DiskScanner(unittest.TestCase):
         for kwargs, entries, answer in values:
             scanner = files.DiskScanner(**kwargs)
             entries = [DuckOSEntry(name=n, mtime=t) for n, t in entries.items()]
-            for f in scanner.filters:
-                entries[:] = f(entries)
-            result = {e.name for e in entries}
+            result = {e.name for e in entries if scanner.match(e)}
+            self.assertSetEqual(result, answer)
+
+    def test_scan_roots(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            roots = []
+            for d in ("a", "b", "c"):
+                root = os.path.join(tmp, d)
+                os.makedirs(os.path.join(root, "sub"))
+                for name in ("1.mp4", "sub/2.mp4", "3.txt"):
+                    open(os.path.join(root, name), "w").close()
+                roots.append(root)
+            scanner = files.DiskScanner(exts={"mp4"})
+            result = {e.path for e in files.scan_roots(roots, scanner.scandir, 1)}
+            answer = {
+                os.path.join(r, n) for r in roots for n in ("1.mp4", "sub/2.mp4")
+            }
             self.assertSetEqual(result, answer)
+            it = files.scan_roots(roots + roots[:1], scanner.scandir, 1)
+            next(it)
+            it.close()
+
+    def test_parallel_scan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for d in ("a/b/c", "a/d", "e/f", "g", "x/y"):
+                os.makedirs(os.path.join(tmp, d))
+            for d in ("", "a", "a/b/c", "a/d", "e/f", "g", "x/y"):
+                for name in ("1.mp4", "2.txt"):
+                    open(os.path.join(tmp, d, name), "w").close()
+            kwargs = {"exts": {"mp4"}, "exclude_dirs": ["x"]}
+            serial = files.DiskScanner(**kwargs)
+            answer = [e.path for e in serial.scandir(tmp)]
+            self.assertEqual(len(answer), 6)
+            scanner = files.DiskScanner(workers=4, **kwargs)
+            self.assertListEqual([e.path for e in scanner.scandir(tmp)], answer)
+            self.assertListEqual(
+                [[e.path for e in d] for d, _ in scanner.walk(tmp)],
+                [[e.path for e in d] for d, _ in serial.walk(tmp)],
+            )
+            scanner = files.DiskScanner(workers=4, ordered=False, **kwargs)
+            self.assertCountEqual([e.path for e in scanner.scandir(tmp)], answer)
+
+    def test_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, "root")
+            path = os.path.join(tmp, "manifest.tsv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(
+                    "./a.mp4\t100\t1000.5\n"
+                    "./x/b.mp4\t100\t2000\n"
+                    "./y/c.mp4\t100\t500\n"
+                    "./y/c.txt\t100\t3000\n"
+                    f"{root}/y/d.mp4\t100\t4000\n"
+                    f"{tmp}/other/e.mp4\t100\t4000\n"
+                    "malformed\n"
+                )
+            scanner = files.DiskScanner(
+                exts={"mp4"}, exclude_dirs=["x"], newer=900, manifest=path
+            )
+            result = list(scanner.scandir(root))
+            self.assertEqual(
+                [e.path for e in result],
+                [os.path.join(root, p) for p in ("a.mp4", "y/d.mp4")],
+            )
+            self.assertEqual(result[0].stat().st_mtime, 1000.5)
+            self.assertEqual(result[0].stat().st_size, 100)
+            self.assertEqual(
+                [[e.name for e in f] for _, f in scanner.walk(root)],
+                [["a.mp4"], ["d.mp4"]],
+            )
+            scanner = files.DiskScanner(recursive=False, manifest=path)
+            self.assertEqual([e.name for e in scanner.scandir(root)], ["a.mp4"])
+            # Relative paths are ambiguous with several roots
+            files.check_manifest(scanner, [root])
+            with self.assertRaises(SystemExit):
+                files.check_manifest(scanner, [root, tmp])
+
+    def test_update_parents(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as db:
+            deep = os.path.join(tmp, "a", "b")
+            os.makedirs(deep)
+            other = os.path.join(tmp, "c")
+            os.mkdir(other)
+            path = os.path.join(deep, "1.mp4")
+            open(path, "w").close()
+            os.utime(path, (1000, 1000))
+            os.utime(other, (500, 500))
+            with state.DirSnapshot(os.path.join(db, "dirs.db")) as snapshot:
+                self.assertEqual(files.update_parents(path, tmp, snapshot), 3)
+                for d in (deep, os.path.dirname(deep), tmp):
+                    self.assertEqual(os.stat(d).st_mtime, 1000)
+                self.assertEqual(files.update_parents(path, other, snapshot), 0)
+
+    def test_update_ancestors(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as db:
+
+            def touch(name, mtime):
+                path = os.path.join(tmp, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, "w").close()
+                os.utime(path, (mtime, mtime))
+
+            def mtime(d):
+                return os.stat(os.path.join(tmp, d)).st_mtime
+
+            for name, t in (("a/b/1", 1000), ("a/c/2", 3000), ("d/3", 2000)):
+                touch(name, t)
+            os.utime(os.path.join(tmp, "d"), (500, 500))
+            dirs = [os.path.join(tmp, d) for d in ("a/b", "a/c", "a/b")]
+            roots = [tmp, os.path.join(tmp, "a")]
+            with state.DirSnapshot(os.path.join(db, "1.db")) as snapshot:
+                # Without a snapshot, d is trusted. The root, a, a/b and a/c
+                self.assertEqual(files.update_ancestors(dirs, roots, snapshot), 4)
+                for d, t in (("", 3000), ("a", 3000), ("a/b", 1000), ("d", 500)):
+                    self.assertEqual(mtime(d), t)
+                self.assertEqual(files.update_ancestors(["/elsewhere"], [tmp]), 0)
+
+            with state.DirSnapshot(os.path.join(db, "2.db")) as snapshot:
+                files._update_tree(tmp, snapshot, False, 2)
+                self.assertEqual(mtime("d"), 2000)
+                # d is changed and e created since the snapshot
+                touch("a/b/4", 4000)
+                touch("d/5", 5000)
+                touch("e/6", 100)
+                dirs = [os.path.join(tmp, "a/b")]
+                self.assertEqual(files.update_ancestors(dirs, [tmp], snapshot), 5)
+                for d, t in (("", 5000), ("a", 4000), ("d", 5000), ("e", 100)):
+                    self.assertEqual(mtime(d), t)
+                # Written back, so nothing is walked again
+                for d in ("", "a", "a/b", "d", "e"):
+                    path = os.path.join(tmp, d).rstrip(os.sep)
+                    self.assertEqual(snapshot.lookup(path), (tmp, mtime(d)))
+                self.assertEqual(files.update_ancestors(dirs, [tmp], snapshot), 0)
+                self.assertEqual(files._update_tree(tmp, snapshot, False, 2), (6, 0))
 
 
 class Test_Concat(unittest.TestCase):
@@ -487,6 +1126,35 @@ class Test_Concat(unittest.TestCase):
             else:
                 self.assertFalse(result)
 
+    def test_probe_groups(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # A fake ffprobe reporting hevc for files named "*x*"
+            ffprobe = os.path.join(tmp, "ffprobe")
+            with open(ffprobe, "w") as f:
+                f.write(
+                    f"#!{sys.executable}\n"
+                    "import json, os, sys\n"
+                    "name = os.path.basename(sys.argv[-1])\n"
+                    "if name.endswith('bad'): sys.exit(1)\n"
+                    "codec = 'hevc' if 'x' in name else 'h264'\n"
+                    "print(json.dumps({'streams': [{'codec_name': codec}]}))\n"
+                )
+            os.chmod(ffprobe, 0o755)
+            groups = []
+            for names in (("a1", "a2"), ("x1", "b2", "x3"), ("c1", "bad")):
+                source = tuple(Path(tmp, n) for n in names)
+                for p in source:
+                    p.touch()
+                groups.append((source, Path(tmp, names[0] + ".out")))
+            result = {
+                g.output.name: g
+                for g in concat.probe_groups(iter(groups), ffprobe=ffprobe)
+            }
+            self.assertEqual(result["a1.out"].status, utils.Status.UPDATED)
+            self.assertEqual(result["x1.out"].status, utils.Status.WARNING)
+            self.assertEqual(len(result["x1.out"].result["Diffs"]), 4)
+            self.assertEqual(result["c1.out"].status, utils.Status.ERROR)
+
 
 if __name__ == "__main__":
     unittest.main()